@@ -0,0 +1,507 @@
+'''================================================================================================
+Resumable download engine for the AVDAT tar files.
+
+A download is streamed in fixed-size chunks to <name>.part, with the server's ETag (or
+Last-Modified) and total size kept next to it in <name>.part.json. If the connection drops,
+or the script is run again after being killed, the download picks up where the .part file
+ends with an HTTP Range request. If-Range makes the server send the whole file instead when it
+changed in the meantime. Once complete, the size and content hash are checked, and only then is
+the file renamed into place, so the destination never holds a partial tar file. fetch_checksum
+finds the hash to check against in a .sha256 or .md5 file published next to the download.
+
+Mirrors that cap the bandwidth of each connection are better served by download_file_segmented,
+which splits the file into byte ranges fetched over several connections into a preallocated
+(sparse) .part file, and falls back to download_file when the server does not take ranges.
+================================================================================================'''
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+PART_SUFFIX = ".part"
+PROGRESS_INTERVAL = 10.0
+# checksum files published next to a download, and the hashlib algorithm of each
+CHECKSUM_SUFFIXES = ((".sha256", "sha256"), (".md5", "md5"))
+
+class DownloadError(Exception):
+    """Raised when a download cannot be completed or fails verification."""
+
+def download_file(url: str, destination: str, *, part_directory: str = None, session: requests.Session = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, expected_size: int = None, expected_hash: str = None,
+                  hash_name: str = "sha256", retries: int = 3, timeout: float = 60) -> dict:
+    """
+    Download a URL to a file, resuming a previous partial download if there is one.
+
+    Args:
+        url (str): The URL to download.
+        destination (str): The final path of the file.
+        part_directory (str, optional): Where to keep the .part file. Defaults to the destination directory.
+            Use a directory that survives between runs for downloads to resume.
+        session (requests.Session, optional): Session to reuse connections from.
+        chunk_size (int, optional): Bytes read and written per chunk. Defaults to 1 MiB.
+        expected_size (int, optional): Size the file must have.
+        expected_hash (str, optional): Hex digest the file must have.
+        hash_name (str, optional): hashlib algorithm of expected_hash. Defaults to "sha256".
+        retries (int, optional): How many times to resume after a dropped connection. Defaults to 3.
+        timeout (float, optional): Connect and read timeout in seconds. Defaults to 60.
+
+    Returns:
+        dict: path, size, hash, seconds, bytes_received and resumed_from of the download.
+
+    Raises:
+        DownloadError: If the download keeps failing, or the size or hash do not match.
+    """
+    if part_directory is None:
+        part_directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(part_directory, exist_ok=True)
+    part_path = os.path.join(part_directory, os.path.basename(destination) + PART_SUFFIX)
+    meta_path = part_path + ".json"
+    session = session or requests.Session()
+
+    start = time.monotonic()
+    bytes_received = 0
+    resumed_from = None
+    for attempt in range(retries + 1):
+        offset, meta = load_part(part_path, meta_path, url)
+        if resumed_from is None:
+            resumed_from = offset
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if meta.get("validator"):
+                headers["If-Range"] = meta["validator"]
+            logging.info(f"Resuming {url} at byte {offset}")
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    if offset and offset == meta.get("total"):
+                        # the .part file was already complete
+                        break
+                    logging.warning(f"{url}: cannot resume at byte {offset}, restarting download")
+                    remove_part(part_path, meta_path)
+                    continue
+                response.raise_for_status()
+                if response.status_code == 206:
+                    first, total = parse_content_range(response.headers.get("Content-Range", ""))
+                    if first != offset:
+                        raise DownloadError(f"{url}: asked for byte {offset}, got {first}")
+                else:
+                    if offset:
+                        logging.warning(f"{url}: server sent the whole file, restarting download")
+                    offset = 0
+                    total = int(response.headers.get("Content-Length", 0)) or None
+                meta = {
+                    "url": url,
+                    "validator": response.headers.get("ETag") or response.headers.get("Last-Modified"),
+                    "total": total,
+                }
+                write_json(meta_path, meta)
+                bytes_received += write_chunks(response, part_path, offset, chunk_size, total)
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            logging.warning(f"Download interrupted: {url} : {e} (attempt {attempt + 1} of {retries + 1})")
+        except requests.HTTPError as e:
+            raise DownloadError(f"{url} : {e}")
+    else:
+        raise DownloadError(f"{url} : gave up after {retries + 1} attempts, keeping {part_path} to resume")
+
+    return finish_download(url, destination, part_path, meta_path, meta.get("total"), start=start,
+                           bytes_received=bytes_received, resumed_from=resumed_from,
+                           expected_size=expected_size, expected_hash=expected_hash, hash_name=hash_name)
+
+def finish_download(url: str, destination: str, part_path: str, meta_path: str, total: int, *, start: float,
+                    bytes_received: int, resumed_from: int, expected_size: int = None,
+                    expected_hash: str = None, hash_name: str = "sha256") -> dict:
+    """
+    Verify a complete .part file and rename it into place.
+
+    Returns:
+        dict: path, size, hash, seconds, bytes_received and resumed_from of the download.
+
+    Raises:
+        DownloadError: If the size or hash do not match, the .part file is removed.
+    """
+    size = os.path.getsize(part_path)
+    digest = file_digest(part_path, hash_name)
+    try:
+        if total is not None and size != total:
+            raise DownloadError(f"{url} : got {size} bytes, server announced {total}")
+        if expected_size is not None and size != expected_size:
+            raise DownloadError(f"{url} : got {size} bytes, expected {expected_size}")
+        if expected_hash is not None and digest != expected_hash.lower():
+            raise DownloadError(f"{url} : {hash_name} {digest} does not match {expected_hash}")
+    except DownloadError:
+        # a complete but wrong file cannot be resumed into a right one
+        remove_part(part_path, meta_path)
+        raise
+
+    move_into_place(part_path, destination)
+    remove_part(part_path, meta_path)
+    seconds = time.monotonic() - start
+    logging.info(
+        f"Downloaded {destination}: {size} bytes, {bytes_received} this run in {seconds:.1f}s "
+        f"({format_rate(bytes_received, seconds)}), {hash_name} {digest}"
+    )
+    return {
+        "path": destination,
+        "size": size,
+        "hash": digest,
+        "seconds": seconds,
+        "bytes_received": bytes_received,
+        "resumed_from": resumed_from,
+    }
+
+def download_file_segmented(url: str, destination: str, *, segments: int = 4, part_directory: str = None,
+                            session: requests.Session = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            expected_size: int = None, expected_hash: str = None, hash_name: str = "sha256",
+                            retries: int = 3, timeout: float = 60) -> dict:
+    """
+    Download a URL over several connections at once, one byte range each.
+
+    The .part file is preallocated to the full size and every range is written at its own offset.
+    How far each range got is saved to <name>.part.json whenever a range finishes and at least
+    every PROGRESS_INTERVAL seconds, so an interrupted or killed download resumes every range
+    close to where it stopped. Servers that do not send "Accept-Ranges: bytes" and a size get a
+    single stream from download_file instead.
+
+    Args:
+        url (str): The URL to download.
+        destination (str): The final path of the file.
+        segments (int, optional): Number of ranges, and connections, to split the file into. Defaults to 4.
+        part_directory (str, optional): Where to keep the .part file. Defaults to the destination directory.
+        session (requests.Session, optional): Session shared by all connections.
+        chunk_size (int, optional): Bytes read and written per chunk, and the smallest range. Defaults to 1 MiB.
+        expected_size (int, optional): Size the file must have.
+        expected_hash (str, optional): Hex digest the file must have.
+        hash_name (str, optional): hashlib algorithm of expected_hash. Defaults to "sha256".
+        retries (int, optional): How many times each range is resumed after a dropped connection. Defaults to 3.
+        timeout (float, optional): Connect and read timeout in seconds. Defaults to 60.
+
+    Returns:
+        dict: path, size, hash, seconds, bytes_received and resumed_from of the download.
+
+    Raises:
+        DownloadError: If a range keeps failing or is left incomplete, or the hash does not match.
+    """
+    single_stream = dict(part_directory=part_directory, session=session, chunk_size=chunk_size,
+                         expected_size=expected_size, expected_hash=expected_hash, hash_name=hash_name,
+                         retries=retries, timeout=timeout)
+    if segments < 2:
+        return download_file(url, destination, **single_stream)
+    if session is None:
+        # one pooled connection per range
+        session = requests.Session()
+        session.mount(url.split("://", 1)[0] + "://", HTTPAdapter(pool_maxsize=segments))
+        single_stream["session"] = session
+
+    try:
+        with session.head(url, allow_redirects=True, timeout=timeout) as response:
+            response.raise_for_status()
+            headers = response.headers
+    except requests.RequestException as e:
+        logging.warning(f"{url} : HEAD failed ({e}), using a single stream")
+        return download_file(url, destination, **single_stream)
+    total = int(headers.get("Content-Length", 0))
+    if headers.get("Accept-Ranges", "").lower() != "bytes" or not total:
+        logging.info(f"{url} : server does not take byte ranges, using a single stream")
+        return download_file(url, destination, **single_stream)
+    validator = headers.get("ETag") or headers.get("Last-Modified")
+
+    if part_directory is None:
+        part_directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(part_directory, exist_ok=True)
+    part_path = os.path.join(part_directory, os.path.basename(destination) + PART_SUFFIX)
+    meta_path = part_path + ".json"
+    meta = load_segments(part_path, meta_path, url, validator, total, segments, chunk_size)
+    resumed_from = sum(pos - first for first, last, pos in meta["segments"])
+    if resumed_from:
+        logging.info(f"Resuming {url}: {resumed_from} of {total} bytes already downloaded")
+
+    start = time.monotonic()
+    pending = [i for i, (first, last, pos) in enumerate(meta["segments"]) if pos <= last]
+    received = [0] * len(meta["segments"])
+    errors = []
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, len(pending)))
+    try:
+        not_done = [
+            pool.submit(fetch_segment, session, url, part_path, meta, i, chunk_size, retries, timeout, received,
+                        stop)
+            for i in pending
+        ]
+        last_report = start
+        while not_done:
+            done, not_done = wait(not_done, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            errors.extend(f.exception() for f in done if f.exception() is not None)
+            # keep how far every range got whenever one finishes, and at least every
+            # PROGRESS_INTERVAL, so a killed run resumes from there
+            save_segments(part_path, meta_path, meta)
+            now = time.monotonic()
+            if not_done and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                logging.info(
+                    f"Downloading: {resumed_from + sum(received)}/{total} bytes over {len(not_done)} connections "
+                    f"({format_rate(sum(received), now - start)})"
+                )
+    finally:
+        # an interrupted run stops every range where it is, and saves that
+        stop.set()
+        pool.shutdown()
+        save_segments(part_path, meta_path, meta)
+    if errors:
+        raise DownloadError(f"{url} : {errors[0]}, keeping {part_path} to resume")
+    # the .part file is preallocated, so its size says nothing; every range must be complete
+    incomplete = [i for i, (first, last, pos) in enumerate(meta["segments"]) if pos <= last]
+    if incomplete:
+        raise DownloadError(f"{url} : ranges {incomplete} are incomplete, keeping {part_path} to resume")
+
+    return finish_download(url, destination, part_path, meta_path, None, start=start,
+                           bytes_received=sum(received), resumed_from=resumed_from,
+                           expected_size=expected_size, expected_hash=expected_hash, hash_name=hash_name)
+
+def load_segments(part_path: str, meta_path: str, url: str, validator: str, total: int, segments: int,
+                  min_size: int) -> dict:
+    """
+    Load the ranges of an interrupted segmented download, or start a new one.
+
+    A new download gets a sparse .part file of the full size and its ranges split evenly, none
+    smaller than min_size. A previous .part file is only reused if it was for the same URL, size
+    and ETag/Last-Modified, and its ranges still cover the whole file.
+
+    Returns:
+        dict: url, validator, total and segments, a list of [first, last, next byte to fetch].
+    """
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if (
+            isinstance(meta, dict)
+            and meta.get("segments")
+            and (meta.get("url"), meta.get("validator"), meta.get("total")) == (url, validator, total)
+            and os.path.getsize(part_path) == total
+            and segments_cover(meta["segments"], total)
+        ):
+            return meta
+    except (OSError, ValueError):
+        pass
+    remove_part(part_path, meta_path)
+
+    count = max(1, min(segments, total // max(1, min_size)))
+    size = -(-total // count)
+    meta = {
+        "url": url,
+        "validator": validator,
+        "total": total,
+        "segments": [[first, min(first + size, total) - 1, first] for first in range(0, total, size)],
+    }
+    with open(part_path, "wb") as f:
+        f.truncate(total)
+    write_json(meta_path, meta)
+    return meta
+
+def segments_cover(segments: list, total: int) -> bool:
+    """
+    Check that [first, last, pos] ranges follow each other from byte 0 to the last byte of total.
+    """
+    expected_first = 0
+    for segment in segments:
+        if not (isinstance(segment, list) and len(segment) == 3 and all(isinstance(n, int) for n in segment)):
+            return False
+        first, last, pos = segment
+        if first != expected_first or last < first or not first <= pos <= last + 1:
+            return False
+        expected_first = last + 1
+    return expected_first == total
+
+def save_segments(part_path: str, meta_path: str, meta: dict):
+    """
+    Save how far every range of a segmented download got.
+
+    The ranges are copied before the .part file is synced, so the saved positions never run
+    ahead of the bytes on disk while fetch_segment keeps writing.
+    """
+    snapshot = dict(meta, segments=[list(segment) for segment in meta["segments"]])
+    with open(part_path, "r+b") as f:
+        os.fsync(f.fileno())
+    write_json(meta_path, snapshot)
+
+def fetch_segment(session: requests.Session, url: str, part_path: str, meta: dict, index: int,
+                  chunk_size: int, retries: int, timeout: float, received: list, stop: threading.Event):
+    """
+    Fetch one byte range into its place in the .part file, resuming it after dropped connections.
+
+    meta["segments"][index][2] is moved forward as bytes are written, and received[index]
+    counts the bytes fetched by this run.
+
+    Raises:
+        DownloadError: If the range cannot be fetched, the file changed on the server, or stop was set.
+    """
+    segment = meta["segments"][index]
+    last = segment[1]
+    for attempt in range(retries + 1):
+        headers = {"Range": f"bytes={segment[2]}-{last}"}
+        if meta.get("validator"):
+            headers["If-Range"] = meta["validator"]
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise DownloadError(f"{url} changed on the server, the next run starts over")
+                first, _ = parse_content_range(response.headers.get("Content-Range", ""))
+                if first != segment[2]:
+                    raise DownloadError(f"{url}: asked for byte {segment[2]}, got {first}")
+                with open(part_path, "r+b") as f:
+                    f.seek(segment[2])
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if stop.is_set():
+                            raise DownloadError(f"range {index} of {url} stopped at byte {segment[2]}")
+                        chunk = chunk[: last + 1 - segment[2]]
+                        f.write(chunk)
+                        # written through before it counts, for save_segments
+                        f.flush()
+                        segment[2] += len(chunk)
+                        received[index] += len(chunk)
+            if segment[2] > last:
+                return
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            logging.warning(f"Range {index} interrupted: {url} : {e} (attempt {attempt + 1} of {retries + 1})")
+        except requests.HTTPError as e:
+            raise DownloadError(f"{url} : {e}")
+    raise DownloadError(f"range {index} of {url} gave up after {retries + 1} attempts")
+
+def fetch_checksum(url: str, *, session: requests.Session = None, timeout: float = 60) -> tuple:
+    """
+    Look for a checksum file published next to url, e.g. avvdat-11234.tar.sha256.
+
+    Args:
+        url (str): The URL of the file to be checked.
+        session (requests.Session, optional): Session to reuse connections from.
+        timeout (float, optional): Connect and read timeout in seconds. Defaults to 60.
+
+    Returns:
+        tuple: (hash_name, hex digest), or (None, None) if no checksum file was found.
+    """
+    session = session or requests.Session()
+    for suffix, hash_name in CHECKSUM_SUFFIXES:
+        try:
+            with session.get(url + suffix, timeout=timeout) as response:
+                if response.status_code != 200:
+                    continue
+                text = response.text
+        except requests.RequestException as e:
+            logging.debug(f"{url + suffix} : {e}")
+            continue
+        # "<digest>  <file name>", as written by sha256sum and md5sum
+        match = re.match(r"\s*([0-9a-fA-F]+)\b", text)
+        if match and len(match.group(1)) == hashlib.new(hash_name).digest_size * 2:
+            logging.info(f"Found {hash_name} checksum: {url + suffix}")
+            return hash_name, match.group(1).lower()
+    return None, None
+
+def load_part(part_path: str, meta_path: str, url: str) -> tuple:
+    """
+    Find out how much of url is already in the .part file.
+
+    Returns:
+        tuple: (offset, meta), offset is 0 and the .part file removed if it cannot be resumed.
+    """
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        # a segmented .part is preallocated, its size says nothing about progress
+        if isinstance(meta, dict) and meta.get("url") == url and "segments" not in meta:
+            return os.path.getsize(part_path), meta
+    except (OSError, ValueError):
+        pass
+    remove_part(part_path, meta_path)
+    return 0, {}
+
+def write_chunks(response: requests.Response, part_path: str, offset: int, chunk_size: int, total: int) -> int:
+    """
+    Append the response body to the .part file at offset.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    written = 0
+    start = last_report = time.monotonic()
+    with open(part_path, "r+b" if offset else "wb") as f:
+        f.seek(offset)
+        f.truncate()
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            f.write(chunk)
+            written += len(chunk)
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                done = f"{offset + written}/{total}" if total else f"{offset + written}"
+                logging.info(f"Downloading: {done} bytes ({format_rate(written, now - start)})")
+        f.flush()
+        os.fsync(f.fileno())
+    return written
+
+def parse_content_range(content_range: str) -> tuple:
+    """
+    Parse a "bytes first-last/total" Content-Range header.
+
+    Returns:
+        tuple: (first, total), total is None if the server did not give one.
+    """
+    match = re.match(r"bytes\s+(\d+)-\d+/(\d+|\*)", content_range)
+    if not match:
+        raise DownloadError(f"Bad Content-Range: {content_range!r}")
+    total = None if match.group(2) == "*" else int(match.group(2))
+    return int(match.group(1)), total
+
+def file_digest(path: str, hash_name: str = "sha256") -> str:
+    """
+    Hash a file in chunks.
+
+    Returns:
+        str: The hex digest.
+    """
+    h = hashlib.new(hash_name)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DEFAULT_CHUNK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def move_into_place(source: str, destination: str):
+    """
+    Atomically replace destination with source, copying first when they are on different filesystems.
+    """
+    try:
+        os.replace(source, destination)
+    except OSError:
+        tmp_path = destination + PART_SUFFIX
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+        os.remove(source)
+
+def remove_part(part_path: str, meta_path: str):
+    for path in (part_path, meta_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def write_json(path: str, data: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def format_rate(byte_count: int, seconds: float) -> str:
+    if seconds <= 0:
+        return "-- MB/s"
+    return f"{byte_count / seconds / (1024 * 1024):.2f} MB/s"
@@ -0,0 +1,222 @@
+'''================================================================================================
+Tar file link extraction for the AVDAT directory listing.
+
+The listing is an Apache/nginx autoindex page, so the tar files are found with the standard
+library's HTMLParser in one pass over the page, and each file's version is parsed from its name
+as its link is found. BeautifulSoup is only imported as a fallback, for pages the fast path
+finds no tar links in even though they mention .tar files.
+
+Versions are AvdatVersion values, compared as numbers rather than strings, and VersionIndex
+keeps every known remote and local tar file sorted by version, so "latest" and "older files to
+prune" are lookups instead of passes over the file names.
+================================================================================================'''
+
+import bisect
+import functools
+import logging
+import os
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+
+# avvdat-11234.tar -> ("avvdat", "11234")
+TAR_NAME_RE = re.compile(r"([^/?#]+?)-(\d+)\.tar$")
+
+TarLink = namedtuple("TarLink", ["name", "version"])
+
+@functools.total_ordering
+class AvdatVersion:
+    """An AVDAT version, ordered by its numbers, e.g. 999 < 1000 and "0000" == "0"."""
+
+    __slots__ = ("text", "key")
+
+    def __init__(self, text: str):
+        self.text = str(text).strip()
+        numbers = re.findall(r"\d+", self.text)
+        if not numbers:
+            raise ValueError(f"Not an AVDAT version: {text!r}")
+        self.key = tuple(int(n) for n in numbers)
+
+    @classmethod
+    def parse(cls, text: str, default: str = "0000") -> "AvdatVersion":
+        """
+        Parse a version, falling back to default for an empty or malformed one.
+
+        Returns:
+            AvdatVersion: The parsed version.
+        """
+        try:
+            return cls(text)
+        except (TypeError, ValueError):
+            logging.warning(f"Not an AVDAT version: {text!r}, using {default}")
+            return cls(default)
+
+    def __eq__(self, other):
+        if not isinstance(other, AvdatVersion):
+            return NotImplemented
+        return self.key == other.key
+
+    def __lt__(self, other):
+        if not isinstance(other, AvdatVersion):
+            return NotImplemented
+        return self.key < other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"AvdatVersion({self.text!r})"
+
+class TarLinkParser(HTMLParser):
+    """Collects the .tar links of an HTML page, with their versions."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        for attr, value in attrs:
+            if attr == "href" and value:
+                link = parse_tar_link(value)
+                if link is not None:
+                    self.links.append(link)
+                return
+
+def parse_tar_link(href: str) -> TarLink:
+    """
+    Parse the version out of a tar file link.
+
+    Args:
+        href (str): The link, e.g. "avvdat-11234.tar".
+
+    Returns:
+        TarLink: (name, AvdatVersion), or None if the link is not a versioned tar file.
+    """
+    match = TAR_NAME_RE.search(href)
+    if match is None:
+        return None
+    return TarLink(href, AvdatVersion(match.group(2)))
+
+def extract_tar_links(html: str) -> list:
+    """
+    Find the versioned tar files linked from a directory listing.
+
+    Args:
+        html (str): The listing page.
+
+    Returns:
+        list: TarLink entries, in page order.
+    """
+    parser = TarLinkParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        logging.warning(f"Listing parser failed: {e}")
+        return extract_tar_links_with_soup(html)
+    if not parser.links and ".tar" in html:
+        logging.debug("No tar links found by the listing parser, trying BeautifulSoup")
+        return extract_tar_links_with_soup(html)
+    return parser.links
+
+def extract_tar_links_with_soup(html: str) -> list:
+    """
+    Find the tar files linked from a page with BeautifulSoup, if it is installed.
+
+    Args:
+        html (str): The listing page.
+
+    Returns:
+        list: TarLink entries, in page order.
+    """
+    try:
+        from bs4 import BeautifulSoup
+    except ImportError:
+        logging.warning("BeautifulSoup is not installed, no fallback for this listing")
+        return []
+    try:
+        soup = BeautifulSoup(html, features="lxml")
+    except Exception:
+        soup = BeautifulSoup(html, features="html.parser")
+    links = (parse_tar_link(link.get("href") or "") for link in soup.find_all("a"))
+    return [link for link in links if link is not None]
+
+class VersionIndex:
+    """
+    Every known AVDAT tar file, remote (in the listing) and local (on disk), by version.
+
+    Versions are kept sorted as they are added, so the latest version is the last one, and the
+    versions older than a given one are a bisect away.
+    """
+
+    def __init__(self):
+        self.versions = []
+        self.remote = {}
+        self.local = {}
+
+    def add(self, version: AvdatVersion):
+        if version not in self.remote and version not in self.local:
+            bisect.insort(self.versions, version)
+
+    def add_remote(self, tar_links: list):
+        """
+        Add the TarLink entries of a listing.
+        """
+        for link in tar_links:
+            self.add(link.version)
+            self.remote[link.version] = link.name
+
+    def add_local(self, paths: list):
+        """
+        Add tar files on disk; paths that are not versioned tar files are ignored.
+        """
+        for path in paths:
+            link = parse_tar_link(os.path.basename(path or ""))
+            if link is not None:
+                self.add(link.version)
+                self.local[link.version] = path
+
+    def latest(self, where: dict = None) -> AvdatVersion:
+        """
+        The highest version, of all files or only those in where (index.remote or index.local).
+
+        Returns:
+            AvdatVersion: The latest version, or None if there is none.
+        """
+        for version in reversed(self.versions):
+            if where is None or version in where:
+                return version
+        return None
+
+    def older_than(self, version: AvdatVersion) -> list:
+        """
+        The versions below version, oldest first.
+        """
+        return self.versions[:bisect.bisect_left(self.versions, version)]
+
+    def prune_local(self, keep: AvdatVersion) -> list:
+        """
+        Delete the local tar files older than keep.
+
+        Returns:
+            list: The paths removed.
+        """
+        removed = []
+        for version in self.older_than(keep):
+            path = self.local.pop(version, None)
+            if path is None:
+                continue
+            try:
+                os.remove(path)
+                removed.append(path)
+                logging.info(f"Removed older tarfile: {path}")
+            except OSError as e:
+                logging.warning(f"Warn: {path} : {e}")
+            if version not in self.remote:
+                self.versions.remove(version)
+        return removed
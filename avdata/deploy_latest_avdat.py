@@ -17,10 +17,11 @@ The script performs the following steps:
 ================================================================================================'''
 
 import configparser
+import json
 import logging
 import colorlog
-from urllib.request import urlretrieve
-from bs4 import BeautifulSoup
+from avdat_download import DownloadError, download_file_segmented, fetch_checksum
+from avdat_listing import AvdatVersion, VersionIndex, extract_tar_links, parse_tar_link
 import requests
 import os
 import shutil
@@ -40,9 +41,17 @@ tmp_directory = config['FILESYSTEM']['tmp_directory']
 avdat_version_file = config['AVDAT']['avdat_version_file']
 last_avdat_version = config['AVDAT']['last_avdat_version']
 tar_files_url = config['AVDAT']['tar_files_url']
+# ETag/Last-Modified and tar files of the last listing, kept in tmp_directory
+listing_cache_file = config.get('AVDAT', 'listing_cache_file', fallback='listing_cache.json')
 
 log_file = config['LOGGING']['log_file']
 
+# bytes per read/write while downloading, and how often to resume a dropped download
+download_chunk_size = config.getint('DOWNLOAD', 'chunk_size', fallback=1024 * 1024)
+download_retries = config.getint('DOWNLOAD', 'retries', fallback=3)
+# connections per download, each fetching its own byte range; 1 downloads in a single stream
+download_segments = config.getint('DOWNLOAD', 'segments', fallback=4)
+
 # Create a logger
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)  # Set the log level to INFO
@@ -274,64 +283,59 @@ def delete_directory(directory_path: str) -> bool:
             raise OSError(f"Error: {directory_path} : {e.strerror}")
     return bool_complete
 
-def download_tar_files(soup: BeautifulSoup, downloads_directory: str, url) -> list:
+def download_tar_files(tar_links: list, downloads_directory: str, url) -> list:
     """
-    Find tar files in the HTML page.
+    Download the newest tar file in the listing, if it is newer than the last AVDAT version.
 
     Args:
-        soup (BeautifulSoup): The HTML page.
+        tar_links (list): The (tar file name, version) links found in the listing.
+        downloads_directory (str): The directory to download to.
+        url (str): The URL of the listing.
 
     Returns:
         list: A list of tar files.
     """
     files = []
-    file_to_download = None
-    current_version = None
-    tarfile_download_path = None
-    for link in soup.find_all('a'):
-        proposed_version = None
-        file  = link.get('href')
-        if file.endswith(".tar"):
-            # strip version off tarfile name
-            logging.info(f"Found tarfile: {file}")   
-            url_tarfile_version = file.split('-')[1].split('.')[0]
-            # if its our first file, set it as the file to download
-            if current_version is None:
-                current_version = url_tarfile_version 
-            proposed_version = url_tarfile_version
-            
-            # if we have a file to download, check if its newer than the current version
-            if url_tarfile_version == last_avdat_version:
-                logging.info(f"AVDAT: {url_tarfile_version} already downloaded")
-                return files
-            elif url_tarfile_version > last_avdat_version:
-                logging.info(f"New AVDAT version found: {file.split('-')[1].split('.')[0]}")
-                if proposed_version > current_version:
-                    file_to_download = file
-                    tarfile_download_path = "%s/%s" % (downloads_directory, file_to_download)
-                    logging.debug(f"Added file to download: {url + file_to_download}")
-                    current_version = proposed_version
-            else:
-                logging.info(f"Older AVDAT version found: {file.split('-')[1].split('.')[0]}")    
+    index = VersionIndex()
+    index.add_remote(tar_links)
+    for link in tar_links:
+        logging.info(f"Found tarfile: {link.name}")
+    
+    # only the newest remote version is downloaded, and only if it is newer than the last one
+    last_version = AvdatVersion.parse(last_avdat_version)
+    latest_version = index.latest(index.remote)
+    if latest_version is None:
+        logging.info("No AVDAT tarfiles listed")
+        return files
+    if latest_version <= last_version:
+        logging.info(f"AVDAT: {latest_version} already downloaded")
+        return files
+    for version in index.older_than(latest_version):
+        logging.info(f"Older AVDAT version found: {version}")
+    logging.info(f"New AVDAT version found: {latest_version}")
+    file_to_download = index.remote[latest_version]
+    tarfile_download_path = "%s/%s" % (downloads_directory, os.path.basename(file_to_download))
+    logging.debug(f"Added file to download: {url + file_to_download}")
     # add the tarfile to the list of files
     files.append(tarfile_download_path)
     
     # download the tarfile
-    # try 3 times
-    if tarfile_download_path is not None:
-        for i in range(3):
-            try:
-                logging.info(f"Downloading tarfile: {url + file_to_download}")
-                # download the tarfile
-                urlretrieve(url + file_to_download, tarfile_download_path)
-                if os.path.exists(tarfile_download_path):
-                    logging.debug(f"Downloaded tarfile: {tarfile_download_path}")
-                    break
-            except Exception as e:
-                logging.error(f"Error: {url + file_to_download} : {e}")
-                if i<3:
-                    continue
-                raise Exception(f"Error: {url + file_to_download} : {e}")
+    # the .part file is kept in tmp_directory, which is not wiped between runs,
+    # so a dropped download resumes instead of starting over
+    try:
+        # the tarfile is checked against the checksum file published next to it, if there is one
+        hash_name, expected_hash = fetch_checksum(url + file_to_download)
+        if expected_hash is None:
+            logging.warning(f"No checksum published for {url + file_to_download}, only checking it is complete")
+        logging.info(f"Downloading tarfile: {url + file_to_download}")
+        download_file_segmented(url + file_to_download, tarfile_download_path, segments=download_segments,
+                                part_directory=tmp_directory, chunk_size=download_chunk_size,
+                                expected_hash=expected_hash, hash_name=hash_name or "sha256",
+                                retries=download_retries)
+        logging.debug(f"Downloaded tarfile: {tarfile_download_path}")
+    except (DownloadError, OSError) as e:
+        logging.error(f"Error: {url + file_to_download} : {e}")
+        raise Exception(f"Error: {url + file_to_download} : {e}")
     return files
 
 def find_latest_tar_file(list_tarfiles: list) -> str:
@@ -344,28 +348,16 @@ def find_latest_tar_file(list_tarfiles: list) -> str:
     Returns:
         str: The latest tar file.
     """
-    latest_tarfile= None
-    previous_tarfile= None
-    for tarfile in list_tarfiles:
-        if not latest_tarfile:
-            latest_tarfile = tarfile
-            logging.info(f"Adding Latest tarfile: {tarfile}")
-        else:
-            current_version = latest_tarfile.split('-')[1]
-            proposed_version = tarfile.split('-')[1]
-            if proposed_version > current_version:
-                previous_tarfile = latest_tarfile
-                latest_tarfile = tarfile
-                update_avdat_version(proposed_version)
-                logging.info(f"Added Newer tarfile: {latest_tarfile}")
-            try:
-                logging.debug(f"Removing older tarfile: {previous_tarfile}")
-                if previous_tarfile:
-                    os.remove(previous_tarfile)
-            except Exception as e:
-                logging.warn(f"Warn: {previous_tarfile} : {e}")
-                pass                
+    index = VersionIndex()
+    index.add_local(list_tarfiles)
+    latest_version = index.latest(index.local)
+    if latest_version is None:
+        logging.info("Latest file: None")
+        return None
+    latest_tarfile = index.local[latest_version]
     logging.info(f"Latest file: {latest_tarfile}")
+    # remove the older tarfiles
+    index.prune_local(latest_version)
     return latest_tarfile
 
 def get_tarfile_basename(tarfile: str) -> str:
@@ -380,19 +372,72 @@ def get_tarfile_basename(tarfile: str) -> str:
     """
     return os.path.basename(tarfile)
 
-def get_soup(url: str) -> BeautifulSoup:
+def get_tar_listing(url: str) -> tuple:
     """
-    Get the HTML page from a URL.
+    Get the tar files listed at a URL, asking the server whether the listing changed first.
+
+    The ETag and Last-Modified of the last listing are sent back as If-None-Match and
+    If-Modified-Since. On 304 Not Modified nothing is downloaded or parsed.
 
     Args:
-        url (str): The URL of the HTML page.
+        url (str): The URL of the listing.
+
+    Returns:
+        tuple: (tar files, listing), tar files is None if the listing did not change since it
+            was saved with save_tar_listing. listing is what to save once the run succeeds.
+    """
+    cached = load_tar_listing(url)
+    headers = {}
+    if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+    r = requests.get(url, headers=headers)
+    if r.status_code == 304 and cached:
+        logging.info(f"Listing not modified since last run: {url}")
+        return None, cached
+    r.raise_for_status()
+    tar_links = extract_tar_links(r.text)
+    listing = {
+        'url': url,
+        'etag': r.headers.get('ETag'),
+        'last_modified': r.headers.get('Last-Modified'),
+        'tar_files': tar_links,
+    }
+    return tar_links, listing
+
+def load_tar_listing(url: str) -> dict:
+    """
+    Load the saved listing of a URL.
 
     Returns:
-        BeautifulSoup: The HTML page.
+        dict: The saved listing, empty if there is none for this URL.
     """
-    r  = requests.get(url)
-    data = r.text
-    return BeautifulSoup(data, features="lxml")
+    listing_file = os.path.join(tmp_directory, listing_cache_file)
+    try:
+        with open(listing_file, "r") as f:
+            listing = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(listing, dict) or listing.get('url') != url:
+        return {}
+    # the tar file names are saved, their versions are parsed again
+    links = (parse_tar_link(name) for name in listing.get('tar_files', []) if isinstance(name, str))
+    listing['tar_files'] = [link for link in links if link is not None]
+    return listing
+
+def save_tar_listing(listing: dict):
+    """
+    Save a listing, so the next run can ask the server whether it changed.
+
+    Only call this once the listing has been fully handled, otherwise a 304 on the next
+    run would skip a tar file that was never downloaded.
+    """
+    listing_file = os.path.join(tmp_directory, listing_cache_file)
+    tmp_file = listing_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(dict(listing, tar_files=[link.name for link in listing['tar_files']]), f)
+    os.replace(tmp_file, listing_file)
 
 def load_config():
     """
@@ -466,28 +511,34 @@ def main():
     last_version_downloaded = load_avdat_version()
     
     
-    #get soup object for the url
-    soup = get_soup(tar_files_url)
+    # get the tar files at the url, unless the listing did not change since the last run
+    tar_links, listing = get_tar_listing(tar_files_url)
     
     logging.info(f"Using : {tar_files_url}")
     
     logging.info(f"Last avdat version downloaded: {last_avdat_version}")
+    
+    if tar_links is None:
+        logging.info("No new avdat version found")
+        logging.info("Completed.")
+        return
         
     # initialize directories:
     #   delete the directory if it exists
     #   create the directory
     # find tar files
-    list_tarfiles= download_tar_files(soup, cache_directory, tar_files_url) 
+    list_tarfiles= download_tar_files(tar_links, cache_directory, tar_files_url) 
     
     # if there are no tar files, exit
     if not list_tarfiles:
+        save_tar_listing(listing)
         logging.info(f"No new avdat version found")
         logging.info(f"Completed.")
         return
     
     # find the latest tar file
     latest_tarfile= find_latest_tar_file(list_tarfiles)
-    last_version_downloaded = latest_tarfile.split('-')[1].split('.')[0]
+    last_version_downloaded = str(parse_tar_link(get_tarfile_basename(latest_tarfile)).version)
     
     logging.info(f"Latest AVDAT tarfile: {latest_tarfile}")
     try:
@@ -500,12 +551,13 @@ def main():
         final_avdat_tarfile = os.path.join(save_directory, tarfile_basename)
         initial_directory_setup(save_directory)
         shutil.move(latest_tarfile, final_avdat_tarfile)
-        update_avdat_version(final_avdat_tarfile.split('-')[1].split('.')[0])
+        update_avdat_version(last_version_downloaded)
         
         logging.info(f"Latest AVDAT tarfile saved: {final_avdat_tarfile}")
         logging.info(f"Prepping file for deployment...")
         
         run_additional_cmds(GLOBAL_ADDITIONAL_CMDS)
+        save_tar_listing(listing)
         
         logging.info(f"Completed.")
     except Exception as e:
@@ -10,9 +10,40 @@ DOCUMENTATION = """
     inventory: script
     version_added: "2.4"
     short_description: Executes an inventory script that returns JSON
+    extends_documentation_fragment:
+      - inventory_cache
     options:
+      plugin:
+        description: Only used by a sources file, must be C(fast_script).
+        required: False
+        choices: ['fast_script']
+      sources:
+        description:
+            - Only read from a sources file (a YAML file named C(*.fast_script.yml) or C(*.fast_script.yaml)).
+            - Inventory scripts, or directories of them, whose C(--list) calls are run concurrently
+              and merged into one inventory. Relative paths are taken from the sources file's directory.
+            - Sources are merged in the order listed, and a directory's scripts in name order.
+              Group memberships and children are combined. For group and host variables set by
+              more than one source, the later source wins.
+            - Each script is cached under its own entry, so with C(cache) and C(cache_soft_ttl)
+              a slow source is refreshed on its own without holding up the others.
+        type: list
+        default: []
+      source_workers:
+        description:
+            - Number of C(sources) scripts whose C(--list) calls run at once.
+            - Set to 1 to run them one after the other. Only used by a sources file.
+        default: 8
+        type: int
+        ini:
+           - section: inventory_plugin_script
+             key: source_workers
+        env:
+           - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_SOURCE_WORKERS
       cache:
-        description: Toggle the usage of the configured Cache plugin.
+        description:
+            - Toggle the usage of the configured Cache plugin.
+            - Also keeps each script's parsed C(--list) output in C(cache_dir) between runs.
         default: False
         type: boolean
         ini:
@@ -20,25 +51,450 @@ DOCUMENTATION = """
              key: cache
         env:
            - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_CACHE
+      cache_dir:
+        description:
+            - Directory holding the parsed C(--list) output of each inventory script between runs.
+            - Only used when C(cache) is enabled.
+            - Entries are dropped when the script's mtime or content changes.
+        default: ~/.ansible/tmp/fast_script_cache
+        type: path
+        ini:
+           - section: inventory_plugin_script
+             key: cache_dir
+        env:
+           - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_CACHE_DIR
+      cache_ttl:
+        description:
+            - Seconds a cached C(--list) result stays valid. Set to 0 to keep it until the script changes.
+            - Past this age the script is always run before the inventory is returned.
+        default: 3600
+        type: int
+        ini:
+           - section: inventory_plugin_script
+             key: cache_ttl
+        env:
+           - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_CACHE_TTL
+      cache_soft_ttl:
+        description:
+            - Seconds after which a cached C(--list) result is served as is while a detached
+              background process reruns the script and refreshes the cache.
+            - Only takes effect below C(cache_ttl). Set to 0 to disable background refreshes.
+        default: 0
+        type: int
+        ini:
+           - section: inventory_plugin_script
+             key: cache_soft_ttl
+        env:
+           - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_CACHE_SOFT_TTL
+      stream:
+        description:
+            - Parse the C(--list) output as it is read instead of buffering it whole, populating
+              groups and host variables as each one is complete. Keeps memory close to the size
+              of the largest single group or host entry for very large inventories.
+            - Ignored when C(cache) is enabled, since the whole result has to be kept to be cached.
+        default: False
+        type: boolean
+        ini:
+           - section: inventory_plugin_script
+             key: stream
+        env:
+           - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_STREAM
+      profile:
+        description:
+            - Path of a JSON report with the wall clock and CPU time spent per phase of the
+              inventory load (script run, UTF-8 decode, JSON parse, group population, C(--host)
+              calls, host variable population) and the number of hosts, groups and variables.
+            - A summary is also shown at verbosity 3 and above. Leave empty to turn profiling off.
+            - CPU time is this process only; the script's own CPU time is reported as C(children_cpu).
+              In C(stream) mode reading, decoding and parsing are one C(stream) phase.
+        default: ''
+        type: str
+        ini:
+           - section: inventory_plugin_script
+             key: profile
+        env:
+           - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_PROFILE
+      host_workers:
+        description:
+            - Number of C(--host) calls to run at once when the script output has no C(_meta.hostvars).
+            - Set to 1 to call the script one host at a time.
+        default: 8
+        type: int
+        ini:
+           - section: inventory_plugin_script
+             key: host_workers
+        env:
+           - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_HOST_WORKERS
+      host_timeout:
+        description:
+            - Seconds to wait for a single C(--host) call before giving up on the whole inventory.
+            - Set to 0 to wait forever.
+        default: 30
+        type: int
+        ini:
+           - section: inventory_plugin_script
+             key: host_timeout
+        env:
+           - name: ANSIBLE_INVENTORY_PLUGIN_SCRIPT_HOST_TIMEOUT
     description:
         - The source provided must an executable that returns Ansible inventory JSON
         - The source must accept C(--list) and C(--host <hostname>) as arguments.
           C(--host) will only be used if no C(_meta) key is present.
           This is a performance optimization as the script would be called per host otherwise.
+        - The source can also be a sources file listing several inventory scripts, see C(sources).
     notes:
         - It takes the place of the previously hardcoded script inventory.
         - To function it requires being whitelisted in configuration, which is true by default.
 """
 
+EXAMPLES = """
+# inventory/discovery.fast_script.yml
+plugin: fast_script
+cache: yes
+cache_soft_ttl: 600
+sources:
+  - nmap_inventory.py
+  - parse2_inventory.py
+  # the CMDB export wins where it disagrees with the scans above
+  - /opt/cmdb/bin/inventory
+"""
+
+import codecs
+import hashlib
+import json
 import os
+import pickle
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
 from collections import Mapping
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 
 from ansible.errors import AnsibleError, AnsibleParserError
 from ansible.module_utils.basic import json_dict_bytes_to_unicode
 from ansible.module_utils.six import iteritems
 from ansible.module_utils._text import to_native, to_text
 from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable
+from ansible.utils.display import Display
+from ansible.utils.vars import combine_vars
+
+display = Display()
+
+
+class InventoryScriptCache(object):
+    """On-disk cache of parsed --list output, one file per inventory script.
+
+    Each file holds a small header pickle (fingerprint and creation time)
+    followed by the zlib-compressed payload, so a stale or mismatched entry is
+    rejected without inflating the inventory itself.
+    """
+
+    VERSION = 1
+
+    # a refresh lock older than this is assumed to belong to a dead process
+    REFRESH_LOCK_TIMEOUT = 600
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def fingerprint(self, path):
+        """Identify a script by its real path, mtime, size and content hash"""
+
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        digest = hashlib.sha256()
+        with open(real, "rb") as script:
+            for chunk in iter(lambda: script.read(65536), b""):
+                digest.update(chunk)
+        return (real, st.st_mtime_ns, st.st_size, digest.hexdigest())
+
+    def entry_path(self, path):
+        name = hashlib.sha1(os.path.realpath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name + ".cache")
+
+    def get(self, path):
+        """Return (data, age in seconds) for path, or None if missing or changed"""
+
+        try:
+            fingerprint = self.fingerprint(path)
+            with open(self.entry_path(path), "rb") as entry:
+                header = pickle.load(entry)
+                if header.get("version") != self.VERSION:
+                    return None
+                if header.get("fingerprint") != fingerprint:
+                    return None
+                age = time.time() - header.get("created", 0)
+                return pickle.loads(zlib.decompress(entry.read())), age
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError, zlib.error):
+            return None
+
+    def set(self, path, data):
+        """Store data for path, replacing any previous entry atomically"""
+
+        try:
+            header = {
+                "version": self.VERSION,
+                "fingerprint": self.fingerprint(path),
+                "created": time.time(),
+            }
+            payload = zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as entry:
+                    pickle.dump(header, entry, pickle.HIGHEST_PROTOCOL)
+                    entry.write(payload)
+                os.replace(tmp, self.entry_path(path))
+            except Exception:
+                os.remove(tmp)
+                raise
+        except (OSError, pickle.PicklingError) as e:
+            display.warning(
+                "fast_script: could not cache %s: %s" % (path, to_native(e))
+            )
+
+    def refresh_in_background(self, path):
+        """Rerun path --list in a detached process that rewrites the cache entry
+
+        Only one refresh per script runs at a time; returns False if another
+        one is already in flight.
+        """
+
+        lock = self.entry_path(path) + ".refresh"
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            try:
+                if time.time() - os.stat(lock).st_mtime > self.REFRESH_LOCK_TIMEOUT:
+                    os.remove(lock)
+            except OSError:
+                pass
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError:
+            return False
+
+        try:
+            with open(os.devnull, "r+b") as devnull:
+                subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), "--refresh",
+                     path, self.cache_dir],
+                    stdin=devnull,
+                    stdout=devnull,
+                    stderr=devnull,
+                    close_fds=True,
+                    start_new_session=True,
+                )
+        except OSError as e:
+            os.remove(lock)
+            display.warning(
+                "fast_script: could not refresh %s: %s" % (path, to_native(e))
+            )
+            return False
+        return True
+
+    def refresh(self, path):
+        """Run path --list and store the result, used by the detached refresh"""
+
+        lock = self.entry_path(path) + ".refresh"
+        try:
+            sp = subprocess.Popen(
+                [path, "--list"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            (stdout, stderr) = sp.communicate()
+            if sp.returncode == 0:
+                data = json.loads(to_text(stdout, errors="strict"))
+                if isinstance(data, Mapping):
+                    self.set(path, data)
+        finally:
+            try:
+                os.remove(lock)
+            except OSError:
+                pass
+
+
+class JsonInventoryStream(object):
+    """Incremental reader for the top level of an inventory script's --list JSON.
+
+    Yields ("group", name, data) for each group and ("hostvars", host, vars)
+    for each entry of _meta.hostvars as soon as it has been read completely,
+    so only one group or host entry is held as text at a time.
+    """
+
+    CHUNK_SIZE = 65536
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")(errors="strict")
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        if self._pos > len(self._buf) // 2:
+            self._buf = self._buf[self._pos :]
+            self._pos = 0
+        chunk = self._stream.read(self.CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            self._buf += self._utf8.decode(b"", final=True)
+        else:
+            self._buf += self._utf8.decode(chunk)
+        return True
+
+    def _peek(self):
+        """Return the next non-whitespace character without consuming it"""
+
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        c = self._peek()
+        if not c or c not in chars:
+            raise ValueError(
+                "expected %s but found %r" % (" or ".join(repr(x) for x in chars), c)
+            )
+        self._pos += 1
+        return c
+
+    def _value(self):
+        """Decode the next complete JSON value"""
+
+        self._peek()
+        attempted = 0
+        while True:
+            pending = len(self._buf) - self._pos
+            # only retry once the buffer has doubled, so a large value is not
+            # re-decoded for every chunk
+            if self._eof or pending >= 2 * attempted:
+                attempted = pending
+                try:
+                    (value, end) = self._decoder.raw_decode(self._buf, self._pos)
+                    # a number at the very end of the buffer may still be cut short
+                    if end < len(self._buf) or self._eof:
+                        self._pos = end
+                        return value
+                except ValueError:
+                    if self._eof:
+                        raise
+            self._fill()
+
+    def _members(self):
+        """Yield the keys of an object, leaving the reader on each key's value"""
+
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            if self._peek() != '"':
+                self._expect('"')
+            key = self._value()
+            self._expect(":")
+            yield key
+            if self._expect(",}") == "}":
+                return
+
+    def __iter__(self):
+        if self._peek() != "{":
+            raise ValueError("needs to be a json dict")
+        for key in self._members():
+            if key != "_meta":
+                yield ("group", key, self._value())
+            elif self._peek() != "{":
+                yield ("meta", key, self._value())
+            else:
+                for meta_key in self._members():
+                    if meta_key == "hostvars":
+                        if self._peek() != "{":
+                            raise ValueError("_meta.hostvars needs to be a json dict")
+                        yield ("hostvars_start", None, None)
+                        for host in self._members():
+                            yield ("hostvars", host, self._value())
+                    else:
+                        yield ("meta", meta_key, self._value())
+        if self._peek():
+            raise ValueError("extra data after the inventory")
+
+
+class InventoryProfile(object):
+    """Wall clock and CPU time per phase of an inventory load, plus item counts.
+
+    Phases timed from several threads at once add up, so their wall clock
+    total can exceed the elapsed time.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._start = (time.time(), time.process_time(), os.times())
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        wall = time.time()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.time() - wall
+            cpu = time.process_time() - cpu
+            with self._lock:
+                stats = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+                stats["wall"] += wall
+                stats["cpu"] += cpu
+                stats["calls"] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self, source):
+        (wall, cpu, times) = self._start
+        now = os.times()
+        return {
+            "source": source,
+            "wall": time.time() - wall,
+            "cpu": time.process_time() - cpu,
+            "children_cpu": (now[2] - times[2]) + (now[3] - times[3]),
+            "phases": self.phases,
+            "counts": self.counts,
+        }
+
+
+class InventoryBatch(object):
+    """Groups, memberships, group variables and children collected from a
+    parsed --list document.
+
+    A document is validated in full before any of it reaches the inventory,
+    and a sources file reads each script's host list back from its batch.
+    Applying a batch still goes through add_host and set_variable once per
+    item, so it is no faster than populating group by group. Dicts are used
+    as ordered sets, keeping the document order while dropping repeats.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.memberships = {}
+        self.group_vars = []
+        self.children = {}
 
 
 class InventoryModule(BaseInventoryPlugin, Cacheable):
@@ -46,127 +502,396 @@ class InventoryModule(BaseInventoryPlugin, Cacheable):
 
     NAME = "fast_script"
 
+    SOURCES_SUFFIXES = (".fast_script.yml", ".fast_script.yaml")
+
     def __init__(self):
         super(InventoryModule, self).__init__()
 
         self._hosts = set()
+        self._groups = set()
+        self._script_cache = None
+        self._profile = InventoryProfile(enabled=False)
 
     def verify_file(self, path):
         """Verify if file is usable by this plugin, base does minimal accessibility check"""
 
         valid = super(InventoryModule, self).verify_file(path)
 
-        if valid:
-            # not only accessible, file must be executable and/or have shebang
-            shebang_present = False
-            try:
-                with open(path, "rb") as inv_file:
-                    initial_chars = inv_file.read(2)
-                    if initial_chars.startswith(b"#!"):
-                        shebang_present = True
-            except:
-                pass
-
-            if not os.access(path, os.X_OK) and not shebang_present:
-                valid = False
+        if valid and not path.endswith(self.SOURCES_SUFFIXES):
+            valid = self._is_script(path)
 
         return valid
 
+    def _is_script(self, path):
+        # not only accessible, file must be executable and/or have shebang
+        shebang_present = False
+        try:
+            with open(path, "rb") as inv_file:
+                initial_chars = inv_file.read(2)
+                if initial_chars.startswith(b"#!"):
+                    shebang_present = True
+        except:
+            pass
+
+        return os.access(path, os.X_OK) or shebang_present
+
     def parse(self, inventory, loader, path, cache=None):
         super(InventoryModule, self).parse(inventory, loader, path)
 
+        sources_file = path.endswith(self.SOURCES_SUFFIXES)
+        if sources_file:
+            self._read_config_data(path)
+
         if cache is None:
             cache = self.get_option("cache")
 
+        # a str option, since a path option turns the empty default into the cwd
+        report = self.get_option("profile")
+        if report:
+            report = os.path.abspath(os.path.expandvars(os.path.expanduser(report)))
+        self._profile = InventoryProfile(enabled=bool(report))
+
+        try:
+            if sources_file:
+                self._parse_sources(path, cache)
+            elif not self.get_option("cache") and self.get_option("stream"):
+                self._parse_stream(path)
+            else:
+                processed = self._load_list(path, cache)
+
+                batch = InventoryBatch()
+                with self._profile.phase("groups"):
+                    data_from_meta = self._collect_document(processed, batch)
+                    self._apply_batch(batch)
+
+                self._populate_all(self._host_vars(path, data_from_meta, self._hosts))
+
+        except Exception as e:
+            raise AnsibleParserError(to_native(e))
+
+        if report:
+            self._write_profile(report, path)
+
+    def _write_profile(self, report, path):
+        self._profile.count("hosts", len(self._hosts))
+        self._profile.count("groups", len(self._groups))
+        data = self._profile.report(to_native(path))
+
+        try:
+            with open(report, "w") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as e:
+            display.warning(
+                "fast_script: could not write profile %s: %s" % (report, to_native(e))
+            )
+
+        display.vvv(
+            "fast_script: loaded %s in %.3fs wall, %.3fs cpu, %.3fs script cpu"
+            % (path, data["wall"], data["cpu"], data["children_cpu"])
+        )
+        for name in sorted(data["phases"]):
+            stats = data["phases"][name]
+            display.vvv(
+                "fast_script:   %-16s %8.3fs wall %8.3fs cpu %7d calls"
+                % (name, stats["wall"], stats["cpu"], stats["calls"])
+            )
+        display.vvv(
+            "fast_script:   %s"
+            % ", ".join("%s=%d" % (k, v) for k, v in sorted(iteritems(data["counts"])))
+        )
+
+    def _populate_all(self, host_vars):
+        """Populate (host, vars) pairs, counting them for the profile"""
+
+        with self._profile.phase("hostvars"):
+            variables = 0
+            for host, got in host_vars:
+                variables += len(got)
+                self._populate_host_vars([host], got)
+        self._profile.count("host_variables", variables)
+
+    def _parse_sources(self, path, cache):
+        """Runs every script listed in a sources file and merges the results"""
+
+        scripts = self._expand_sources(path)
+        if not scripts:
+            raise AnsibleError("no inventory scripts found in sources of %s" % path)
+
+        workers = max(1, min(self.get_option("source_workers") or 1, len(scripts)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self._load_list, s, cache) for s in scripts]
+            documents = [f.result() for f in futures]
+
+        # groups are applied source by source, so later group vars override
+        # earlier ones; host vars are combined the same way below
+        hostvars = {}
+        for script, processed in zip(scripts, documents):
+            batch = InventoryBatch()
+            with self._profile.phase("groups"):
+                data_from_meta = self._collect_document(processed, batch)
+                self._apply_batch(batch)
+
+            hosts = dict((h, None) for (h, g) in batch.memberships)
+            for host, got in self._host_vars(script, data_from_meta, hosts):
+                hostvars[host] = combine_vars(hostvars.get(host, {}), got)
+
+        self._populate_all(iteritems(hostvars))
+
+    def _expand_sources(self, path):
+        """Resolve the sources option to a list of scripts, directories expanded in name order"""
+
+        base = os.path.dirname(os.path.abspath(path))
+        scripts = []
+        for source in self.get_option("sources") or []:
+            source = os.path.join(base, os.path.expanduser(to_native(source)))
+            if os.path.isdir(source):
+                for name in sorted(os.listdir(source)):
+                    candidate = os.path.join(source, name)
+                    if (
+                        not name.startswith(".")
+                        and not name.endswith(self.SOURCES_SUFFIXES)
+                        and os.path.isfile(candidate)
+                        and self._is_script(candidate)
+                    ):
+                        scripts.append(candidate)
+            else:
+                scripts.append(source)
+        return scripts
+
+    def _load_list(self, path, cache):
+        """Return the parsed --list output of path, from the cache when allowed
+
+        The cache argument, which ansible always passes as True, only allows
+        reuse of this process's in-memory cache; the on-disk cache is used
+        only when the cache option is enabled.
+        """
+
+        disk_cache = self.get_option("cache")
+        cache_key = self._get_cache_prefix(path)
+        if not cache or cache_key not in self._cache:
+            processed = None
+            if disk_cache:
+                processed = self._get_cached_list(path)
+            if processed is None:
+                processed = self._run_list(path)
+                if disk_cache:
+                    self._get_script_cache().set(path, processed)
+            self._cache[cache_key] = processed
+
+        processed = self._cache[cache_key]
+        if not isinstance(processed, Mapping):
+            raise AnsibleError(
+                "failed to parse executable inventory script results from {0}: needs to be a json dict".format(
+                    path
+                )
+            )
+        return processed
+
+    def _collect_document(self, processed, batch):
+        """Collect every group of a --list document into batch
+
+        Returns _meta.hostvars, or None if the document has none.
+        """
+
+        data_from_meta = None
+
+        # A "_meta" subelement may contain a variable "hostvars" which contains a hash for each host
+        # if this "hostvars" exists at all then do not call --host for each # host.
+        # This is for efficiency and scripts should still return data
+        # if called with --host for backwards compat with 1.2 and earlier.
+        for group, gdata in processed.items():
+            if group == "_meta":
+                if "hostvars" in gdata:
+                    data_from_meta = gdata["hostvars"]
+            else:
+                self._collect_group(group, gdata, batch)
+
+        return data_from_meta
+
+    def _host_vars(self, path, data_from_meta, hosts):
+        """Return (host, vars) for hosts, from _meta.hostvars or by calling --host"""
+
+        if data_from_meta is None:
+            return self._get_all_host_variables(path, hosts)
+
+        host_vars = []
+        for host in hosts:
+            try:
+                got = data_from_meta.get(host, {})
+            except AttributeError as e:
+                raise AnsibleError(
+                    "Improperly formatted host information for %s: %s"
+                    % (host, to_native(e))
+                )
+            host_vars.append((host, got))
+        return host_vars
+
+    def _get_script_cache(self):
+        # only built once caching is actually requested
+        if self._script_cache is None:
+            self._script_cache = InventoryScriptCache(self.get_option("cache_dir"))
+        return self._script_cache
+
+    def _get_cached_list(self, path):
+        """Return the cached --list result for path if it is still usable
+
+        Past cache_soft_ttl the cached result is still returned, but a detached
+        process is started to refresh it for the next run. Past cache_ttl the
+        entry is ignored and the caller has to run the script itself.
+        """
+
+        script_cache = self._get_script_cache()
+        entry = script_cache.get(path)
+        if entry is None:
+            return None
+
+        (processed, age) = entry
+        ttl = self.get_option("cache_ttl")
+        soft_ttl = self.get_option("cache_soft_ttl")
+        if ttl and age > ttl:
+            return None
+        if soft_ttl and age > soft_ttl:
+            if script_cache.refresh_in_background(path):
+                display.vvv(
+                    "fast_script: cache for %s is %ds old, refreshing in the background"
+                    % (path, age)
+                )
+        return processed
+
+    def _run_list(self, path):
+        """Runs <script> --list and returns the parsed inventory"""
+
         # Support inventory scripts that are not prefixed with some
         # path information but happen to be in the current working
         # directory when '.' is not in PATH.
         cmd = [path, "--list"]
 
+        with self._profile.phase("spawn"):
+            try:
+                sp = subprocess.Popen(
+                    cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+            except OSError as e:
+                raise AnsibleParserError(
+                    "problem running %s (%s)" % (" ".join(cmd), to_native(e))
+                )
+            (stdout, stderr) = sp.communicate()
+        self._profile.count("bytes", len(stdout))
+
+        path = to_native(path)
+        err = to_native(stderr or "") + "\n"
+
+        if sp.returncode != 0:
+            raise AnsibleError(
+                "Inventory script (%s) had an execution error: %s " % (path, err)
+            )
+
+        # make sure script output is unicode so that json loader will output
+        # unicode strings itself
         try:
-            cache_key = self._get_cache_prefix(path)
-            if not cache or cache_key not in self._cache:
-                try:
-                    sp = subprocess.Popen(
-                        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                    )
-                except OSError as e:
-                    raise AnsibleParserError(
-                        "problem running %s (%s)" % (" ".join(cmd), to_native(e))
-                    )
-                (stdout, stderr) = sp.communicate()
+            with self._profile.phase("decode"):
+                data = to_text(stdout, errors="strict")
+        except Exception as e:
+            raise AnsibleError(
+                "Inventory {0} contained characters that cannot be interpreted as UTF-8: {1}".format(
+                    path, to_native(e)
+                )
+            )
 
-                path = to_native(path)
-                err = to_native(stderr or "") + "\n"
+        try:
+            with self._profile.phase("json_parse"):
+                return self.loader.load(data, file_name=path)
+        except Exception as e:
+            raise AnsibleError(
+                "failed to parse executable inventory script results from {0}: {1}\n{2}".format(
+                    path, to_native(e), err
+                )
+            )
 
-                if sp.returncode != 0:
-                    raise AnsibleError(
-                        "Inventory script (%s) had an execution error: %s "
-                        % (path, err)
-                    )
+    def _parse_stream(self, path):
+        """Runs <script> --list and populates the inventory while reading its output"""
 
-                # make sure script output is unicode so that json loader will output
-                # unicode strings itself
-                try:
-                    data = to_text(stdout, errors="strict")
-                except Exception as e:
-                    raise AnsibleError(
-                        "Inventory {0} contained characters that cannot be interpreted as UTF-8: {1}".format(
-                            path, to_native(e)
-                        )
-                    )
+        cmd = [path, "--list"]
+        # stderr goes to a file so a chatty script cannot block on a full pipe
+        # while stdout is being read
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                with self._profile.phase("spawn"):
+                    sp = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+            except OSError as e:
+                raise AnsibleParserError(
+                    "problem running %s (%s)" % (" ".join(cmd), to_native(e))
+                )
 
-                try:
-                    self._cache[cache_key] = self.loader.load(data, file_name=path)
-                except Exception as e:
-                    raise AnsibleError(
-                        "failed to parse executable inventory script results from {0}: {1}\n{2}".format(
-                            path, to_native(e), err
-                        )
+            path = to_native(path)
+            data_from_meta = False
+            pending = {}
+            populated = set()
+            try:
+                # A "_meta" subelement may contain a variable "hostvars" which contains a hash for each host
+                # hosts listed there before their group is seen are held back until the end,
+                # so only grouped hosts get populated, same as the buffered parse.
+                with self._profile.phase("stream"):
+                    for kind, name, data in JsonInventoryStream(sp.stdout):
+                        if kind == "group":
+                            with self._profile.phase("groups"):
+                                self._parse_group(name, data)
+                        elif kind == "hostvars_start":
+                            data_from_meta = True
+                        elif kind == "hostvars":
+                            if not isinstance(data, Mapping):
+                                raise AnsibleError(
+                                    "Improperly formatted host information for %s: %s"
+                                    % (name, data)
+                                )
+                            if name in self._hosts:
+                                self._populate_all([(name, data)])
+                                populated.add(name)
+                            else:
+                                pending[name] = data
+            except UnicodeDecodeError as e:
+                sp.kill()
+                raise AnsibleError(
+                    "Inventory {0} contained characters that cannot be interpreted as UTF-8: {1}".format(
+                        path, to_native(e)
                     )
-
-            processed = self._cache[cache_key]
-            if not isinstance(processed, Mapping):
+                )
+            except ValueError as e:
+                sp.kill()
                 raise AnsibleError(
-                    "failed to parse executable inventory script results from {0}: needs to be a json dict\n{1}".format(
-                        path, err
+                    "failed to parse executable inventory script results from {0}: {1}".format(
+                        path, to_native(e)
                     )
                 )
+            finally:
+                sp.stdout.close()
+                sp.wait()
 
-            group = None
-            data_from_meta = None
-
-            # A "_meta" subelement may contain a variable "hostvars" which contains a hash for each host
-            # if this "hostvars" exists at all then do not call --host for each # host.
-            # This is for efficiency and scripts should still return data
-            # if called with --host for backwards compat with 1.2 and earlier.
-            for group, gdata in processed.items():
-                if group == "_meta":
-                    if "hostvars" in gdata:
-                        data_from_meta = gdata["hostvars"]
-                else:
-                    self._parse_group(group, gdata)
-
-            for host in self._hosts:
-                got = {}
-                if data_from_meta is None:
-                    got = self.get_host_variables(path, host)
-                else:
-                    try:
-                        got = data_from_meta.get(host, {})
-                    except AttributeError as e:
-                        raise AnsibleError(
-                            "Improperly formatted host information for %s: %s"
-                            % (host, to_native(e))
-                        )
-
-                self._populate_host_vars([host], got)
+            if sp.returncode != 0:
+                stderr.seek(0)
+                raise AnsibleError(
+                    "Inventory script (%s) had an execution error: %s "
+                    % (path, to_native(stderr.read()) + "\n")
+                )
 
-        except Exception as e:
-            raise AnsibleParserError(to_native(e))
+        if not data_from_meta:
+            self._populate_all(self._get_all_host_variables(path, self._hosts))
+        else:
+            self._populate_all(
+                (host, pending.get(host, {}))
+                for host in self._hosts
+                if host not in populated
+            )
 
     def _parse_group(self, group, data):
-        self.inventory.add_group(group)
+        batch = InventoryBatch()
+        self._collect_group(group, data, batch)
+        self._apply_batch(batch)
+
+    def _collect_group(self, group, data, batch):
+        """Validate one group's data and record it in batch without touching the inventory"""
+
+        batch.groups[group] = None
 
         if not isinstance(data, dict):
             data = {"hosts": data}
@@ -182,8 +907,7 @@ class InventoryModule(BaseInventoryPlugin, Cacheable):
                 )
 
             for hostname in data["hosts"]:
-                self._hosts.add(hostname)
-                self.inventory.add_host(hostname, group)
+                batch.memberships[(hostname, group)] = None
 
         if "vars" in data:
             if not isinstance(data["vars"], dict):
@@ -193,27 +917,122 @@ class InventoryModule(BaseInventoryPlugin, Cacheable):
                 )
 
             for k, v in iteritems(data["vars"]):
-                self.inventory.set_variable(group, k, v)
+                batch.group_vars.append((group, k, v))
 
         if group != "_meta" and isinstance(data, dict) and "children" in data:
             for child_name in data["children"]:
-                self.inventory.add_group(child_name)
-                self.inventory.add_child(group, child_name)
+                batch.groups[child_name] = None
+                batch.children[(group, child_name)] = None
+
+    def _apply_batch(self, batch):
+        """Add everything collected in batch to the inventory, groups first
+
+        Each item goes through the regular InventoryData calls, so the
+        inventory ends up exactly as a group by group parse would leave it.
+        """
+
+        for group in batch.groups:
+            if group not in self._groups:
+                self._groups.add(group)
+                self.inventory.add_group(group)
+
+        for hostname, group in batch.memberships:
+            self._hosts.add(hostname)
+            self.inventory.add_host(hostname, group)
+
+        for group, k, v in batch.group_vars:
+            self.inventory.set_variable(group, k, v)
+        self._profile.count("group_variables", len(batch.group_vars))
+
+        for group, child_name in batch.children:
+            self.inventory.add_child(group, child_name)
+
+    def _get_all_host_variables(self, path, hosts):
+        """Runs <script> --host for every host on a bounded worker pool.
+
+        Results come back sorted by hostname, whatever order the calls finish in.
+        """
+
+        hosts = sorted(hosts)
+        workers = max(1, self.get_option("host_workers") or 1)
+        timeout = self.get_option("host_timeout") or None
+
+        start = time.time()
+        with self._profile.phase("host_calls"):
+            results = self._run_host_calls(path, hosts, workers, timeout)
+        elapsed = time.time() - start
+
+        # each call is timed on its own, so running them one by one costs the sum
+        serial = sum(t for (got, t) in results)
+        display.vvv(
+            "fast_script: %d --host calls with %d workers took %.2fs "
+            "(%.2fs serial, %.2fs saved)"
+            % (len(hosts), workers, elapsed, serial, max(0.0, serial - elapsed))
+        )
+
+        return [(h, got) for (h, (got, t)) in zip(hosts, results)]
 
-    def get_host_variables(self, path, host):
+    def _run_host_calls(self, path, hosts, workers, timeout):
+        if workers == 1 or len(hosts) < 2:
+            results = [self._timed_host_variables(path, h, timeout) for h in hosts]
+        else:
+            pool = ThreadPoolExecutor(max_workers=min(workers, len(hosts)))
+            try:
+                futures = [
+                    pool.submit(self._timed_host_variables, path, h, timeout)
+                    for h in hosts
+                ]
+                (done, not_done) = wait(futures, return_when=FIRST_EXCEPTION)
+                for f in done:
+                    if f.exception() is not None:
+                        raise f.exception()
+            except BaseException:
+                # the first failure fails the inventory, so the --host calls
+                # still queued are dropped instead of run to no purpose
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            pool.shutdown()
+            results = [f.result() for f in futures]
+        return results
+
+    def _timed_host_variables(self, path, host, timeout):
+        start = time.time()
+        got = self.get_host_variables(path, host, timeout)
+        return got, time.time() - start
+
+    def get_host_variables(self, path, host, timeout=None):
         """Runs <script> --host <hostname>, to determine additional host variables"""
 
         cmd = [path, "--host", host]
-        try:
-            sp = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except OSError as e:
-            raise AnsibleError("problem running %s (%s)" % (" ".join(cmd), e))
-        (out, err) = sp.communicate()
-        if out.strip() == "":
+        with self._profile.phase("host_spawn"):
+            try:
+                sp = subprocess.Popen(
+                    cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+            except OSError as e:
+                raise AnsibleError("problem running %s (%s)" % (" ".join(cmd), e))
+            try:
+                (out, err) = sp.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                sp.kill()
+                sp.communicate()
+                raise AnsibleError(
+                    "timed out after %ss running %s" % (timeout, " ".join(cmd))
+                )
+        if out.strip() == b"":
             return {}
         try:
-            return json_dict_bytes_to_unicode(self.loader.load(out, file_name=path))
+            with self._profile.phase("host_json_parse"):
+                return json_dict_bytes_to_unicode(
+                    self.loader.load(out, file_name=path)
+                )
         except ValueError:
             raise AnsibleError(
                 "could not parse post variable response: %s, %s" % (cmd, out)
             )
+
+
+if __name__ == "__main__":
+    # detached cache refresh, see InventoryScriptCache.refresh_in_background
+    if len(sys.argv) == 4 and sys.argv[1] == "--refresh":
+        InventoryScriptCache(sys.argv[3]).refresh(sys.argv[2])
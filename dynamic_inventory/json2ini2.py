@@ -1,6 +1,12 @@
 # Import the json and configparser modules
 import configparser
 import json
+import os
+import sys
+
+# the streaming hosts.json reader lives with the other libs in ./v1
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "v1"))
+from libhostsjson import write_hosts_inventory
 
 json_file = "./hosts.json"
 inventory_file = "./inventory"
@@ -52,10 +58,9 @@ def main():
     # json_file = input("Enter the JSON file name: ") or "./hosts.json"
     # Get the INI file name from the user input or use the default
     # ini_file = input("Enter the INI file name: ") or "./hosts.ini"
-    # Call the load_json function and get the JSON data
-    json_data = load_json(json_file)
-    # Call the write_ini function and write the INI data to the file
-    write_ini(json_data, inventory_file)
+    # stream _meta.hostvars out of the export instead of loading it whole,
+    # printing each named device as write_ini does
+    write_hosts_inventory(json_file, inventory_file, on_device=print)
     # Print a success message
     # print(f"Successfully converted {json_file} to {ini_file}")
 
@@ -0,0 +1,281 @@
+# run the discovery pipeline from run.sh, skipping stages whose inputs did not change
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+
+# the hosts.json and os-data.json readers live with the other libs in ./v1
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "v1"))
+from libatomicfile import atomic_open, write_file_atomic
+from libhostsjson import write_hosts_inventory
+from libosdata import load_os_data
+
+import sortos
+
+debug = False
+
+base_directory = os.path.dirname(os.path.abspath(__file__))
+state_file = ".pipeline.json"
+
+# ansible exits 2 when some hosts failed and 4 when some were
+# unreachable; the output still has a block for every host, as
+# run.sh relies on
+ANSIBLE_OK_CODES = (0, 2, 4)
+
+""" =========================================================
+Stages of run.sh, each with the files it reads and writes:
+
+  scan     nmap.yaml          -> hosts.json   (ansible-inventory, nmap plugin)
+  copy     hosts.json         -> ./hosts.json (only with --scan-dir)
+  convert  ./hosts.json       -> inventory    (json2ini2)
+  facts    inventory          -> os-data.json (ansible -m setup)
+  osdata   os-data.json       -> os-data.table
+  sortos   os-data.table      -> inventory-os (groups per distro-major)
+
+A stage is skipped when the sha256 of every input and output
+matches what was recorded the last time it ran, along with its
+command. The hashes are kept in .pipeline.json with each file's
+mtime and size, so unchanged files are not read again just to be
+hashed. Every stage reads what the one before it wrote, so they
+run one after another, in the order above; when a stage fails,
+the stages that need its outputs are reported as blocked.
+
+Like run.sh, the scan runs from the scan directory, so ansible
+picks up the ansible.cfg there, and everything else runs from
+this directory.
+
+The scan and the fact gathering look at the network, not just at
+their inputs; use --force scan (or --force all) to redo them.
+============================================================="""
+
+
+@dataclass
+class Stage:
+    """Class for one pipeline step and the files it reads and writes"""
+
+    name: str
+    inputs: list
+    outputs: list
+    run: object
+    command: list = field(default_factory=list)
+
+    def signature(self) -> str:
+        return json.dumps(self.command)
+
+
+def file_digest(path, known) -> str:
+    """sha256 of path, reusing the recorded one while mtime and size match"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return ""
+    stamp = [st.st_mtime_ns, st.st_size]
+    entry = known.get(path)
+    if entry and entry.get("stamp") == stamp:
+        return entry["sha256"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    known[path] = {"stamp": stamp, "sha256": h.hexdigest()}
+    return known[path]["sha256"]
+
+
+def check_returncode(command, returncode, ok_codes):
+    if returncode not in ok_codes:
+        raise subprocess.CalledProcessError(returncode, command)
+    if returncode:
+        print("%s: exit code %d, output kept" % (command[0], returncode), file=sys.stderr)
+
+
+def run_command(command, stdout_file=None, ok_codes=(0,), cwd=base_directory):
+    # stdout is written to a temp file first, so a failed run never
+    # leaves a half written output for the next stage to pick up
+    if stdout_file is None:
+        result = subprocess.run(command, cwd=cwd)
+        check_returncode(command, result.returncode, ok_codes)
+        return
+    with atomic_open(stdout_file) as f:
+        result = subprocess.run(command, cwd=cwd, stdout=f)
+        check_returncode(command, result.returncode, ok_codes)
+
+
+def sort_os(os_data_file, os_table_file, output):
+    table = load_os_data(os_data_file, os_table_file)
+    layout = sortos.load_os_vars_layout(sortos.os_vars_directory)
+    write_file_atomic(output, sortos.format_os_inventory(*sortos.sort_hosts(table, layout)))
+
+
+def build_stages(scan_directory) -> list:
+    local_json = os.path.join(base_directory, "hosts.json")
+    scan_json = os.path.join(scan_directory, "hosts.json")
+    nmap_file = os.path.join(scan_directory, "nmap.yaml")
+    inventory_file = os.path.join(base_directory, "inventory")
+    os_data_file = os.path.join(base_directory, "os-data.json")
+    os_table_file = os.path.join(base_directory, "os-data.table")
+    sortos_file = os.path.join(base_directory, "inventory-os")
+
+    scan_command = [
+        "ansible-inventory", "-i", nmap_file,
+        "--export", "--output=%s" % scan_json, "--list",
+    ]
+    facts_command = [
+        "ansible", "all", "-m", "setup",
+        "-a", "filter=ansible_distribution*", "-i", inventory_file,
+    ]
+
+    stages = [
+        Stage(
+            "scan", [nmap_file], [scan_json],
+            lambda: run_command(scan_command, cwd=scan_directory), scan_command,
+        ),
+    ]
+    if scan_json != local_json:
+        stages.append(
+            Stage(
+                "copy", [scan_json], [local_json],
+                lambda: shutil.copyfile(scan_json, local_json), ["copy"],
+            )
+        )
+    stages += [
+        Stage(
+            "convert", [local_json], [inventory_file],
+            lambda: write_hosts_inventory(local_json, inventory_file), ["json2ini2"],
+        ),
+        Stage(
+            "facts", [inventory_file], [os_data_file],
+            lambda: run_command(facts_command, os_data_file, ANSIBLE_OK_CODES),
+            facts_command,
+        ),
+        Stage(
+            "osdata", [os_data_file], [os_table_file],
+            lambda: load_os_data(os_data_file, os_table_file), ["libosdata", 1],
+        ),
+        Stage(
+            "sortos", [os_data_file, os_table_file], [sortos_file],
+            lambda: sort_os(os_data_file, os_table_file, sortos_file), ["sortos"],
+        ),
+    ]
+    return stages
+
+
+""" =========================================================
+Run stages in order
+
+Return Type: dict of stage name -> {"status", "seconds"},
+             status is ran, skipped, failed or blocked
+============================================================="""
+
+
+def run_pipeline(stages, state_path, force=()) -> dict:
+    state = load_state(state_path)
+    known = state["files"]
+    producers = {out: s.name for s in stages for out in s.outputs}
+    results = {}
+    for stage in stages:
+        needs = {producers[i] for i in stage.inputs if i in producers} - {stage.name}
+        if any(results[n]["status"] in ("failed", "blocked") for n in needs):
+            results[stage.name] = {"status": "blocked", "seconds": 0.0}
+            print("%-8s blocked" % stage.name)
+            continue
+        results[stage.name] = run_stage(
+            stage, state, known, stage.name in force or "all" in force
+        )
+        print(
+            "%-8s %-8s %7.2fs"
+            % (stage.name, results[stage.name]["status"], results[stage.name]["seconds"])
+        )
+
+    state["timings"] = results
+    save_state(state_path, state)
+    return results
+
+
+def run_stage(stage, state, known, force=False) -> dict:
+    start = time.perf_counter()
+    record = {
+        "command": stage.signature(),
+        "inputs": {p: file_digest(p, known) for p in stage.inputs},
+    }
+    previous = state["stages"].get(stage.name)
+    if (
+        not force
+        and previous is not None
+        and previous.get("command") == record["command"]
+        and previous.get("inputs") == record["inputs"]
+        and all(file_digest(p, known) == h and h for p, h in previous["outputs"].items())
+    ):
+        return {"status": "skipped", "seconds": time.perf_counter() - start}
+
+    if any(not h for h in record["inputs"].values()):
+        missing = [p for p, h in record["inputs"].items() if not h]
+        print("%s: missing input %s" % (stage.name, ", ".join(missing)), file=sys.stderr)
+        return {"status": "failed", "seconds": time.perf_counter() - start}
+
+    try:
+        stage.run()
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print("%s: %s" % (stage.name, e), file=sys.stderr)
+        state["stages"].pop(stage.name, None)
+        return {"status": "failed", "seconds": time.perf_counter() - start}
+
+    record["outputs"] = {p: file_digest(p, known) for p in stage.outputs}
+    state["stages"][stage.name] = record
+    return {"status": "ran", "seconds": time.perf_counter() - start}
+
+
+def load_state(file) -> dict:
+    empty = {"version": 1, "files": {}, "stages": {}}
+    try:
+        with open(file, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if not isinstance(state, dict) or state.get("version") != 1:
+        return empty
+    return state
+
+
+def save_state(file, state):
+    with atomic_open(file) as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+
+# Define a main function
+def main():
+    parser = argparse.ArgumentParser(description="run the dynamic inventory pipeline")
+    parser.add_argument(
+        "--scan-dir",
+        default=base_directory,
+        help="directory holding nmap.yaml; hosts.json is copied from there",
+    )
+    parser.add_argument(
+        "--force",
+        action="append",
+        default=[],
+        help="stage to run even if unchanged, or all (repeatable)",
+    )
+    args = parser.parse_args()
+
+    stages = build_stages(os.path.abspath(args.scan_dir))
+    unknown = set(args.force) - {s.name for s in stages} - {"all"}
+    if unknown:
+        parser.error("unknown stage: %s" % ", ".join(sorted(unknown)))
+    start = time.perf_counter()
+    results = run_pipeline(
+        stages, os.path.join(base_directory, state_file), set(args.force)
+    )
+    print("total    %17.2fs" % (time.perf_counter() - start))
+    if any(r["status"] in ("failed", "blocked") for r in results.values()):
+        sys.exit(1)
+
+
+# Check if the script is run as the main module
+if __name__ == "__main__":
+    # Call the main function
+    main()
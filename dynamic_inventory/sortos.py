@@ -1 +1,197 @@
 # sort hostfile entries by os type/version into folders/seperate inventory files
+import argparse
+import os
+import re
+import sys
+
+# the os-data.json parser lives with the other libs in ./v1
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "v1"))
+from libatomicfile import write_file_atomic
+from libosdata import CHANGED, SUCCESS, UNREACHABLE, load_os_data
+
+debug = False
+
+base_directory = os.path.dirname(os.path.abspath(__file__))
+os_data_file = os.path.join(base_directory, "os-data.json")
+os_table_file = os.path.join(base_directory, "os-data.table")
+os_vars_directory = os.path.join(base_directory, "dynamicOS", "dynamicos")
+inventory_file = os.path.join(base_directory, "inventory-os")
+
+""" =========================================================
+Group hosts by os, from the facts in os-data.json
+
+Every host that answered is put in a <Distro>-<major> group, e.g.
+Fedora-39, and that group in a group per package manager:
+
+  [Debian-12]
+  172.16.30.71
+
+  [Debian-12:vars]
+  os_distro=Debian
+  os_major=12
+  package_manager=apt
+  os_vars_file=dynamicos/apt/Debian-12.yml
+
+  [apt:children]
+  Debian-11
+  Debian-12
+
+so playbooks can target Fedora-39 or dnf and load os_vars_file
+without gathering facts on every host first. The package manager
+and the spelling of each group come from the dynamicOS/dynamicos
+<manager>/<Distro>-<major>.yml layout, matched without case (so
+Archlinux hosts land in ArchLinux-NA), with a built in table for
+distros that have no var file yet. Groups with no var file get no
+os_vars_file and go under [no_os_vars:children] instead of their
+package manager group, so playbooks that load os_vars_file for
+apt, dnf or pacman hosts never meet an undefined one.
+============================================================="""
+
+# distro (lower case) -> package manager, for distros with no var file
+PACKAGE_MANAGERS = {
+    "debian": "apt",
+    "ubuntu": "apt",
+    "raspbian": "apt",
+    "linux mint": "apt",
+    "pop!_os": "apt",
+    "fedora": "dnf",
+    "redhat": "dnf",
+    "centos": "dnf",
+    "rocky": "dnf",
+    "almalinux": "dnf",
+    "oraclelinux": "dnf",
+    "archlinux": "pacman",
+    "manjaro": "pacman",
+    "endeavouros": "pacman",
+}
+
+UNKNOWN_MANAGER = "unknown"
+
+# parent of the distro-major groups that have no var file
+NO_VARS_GROUP = "no_os_vars"
+
+
+def load_os_vars_layout(directory) -> dict:
+    """map lower cased "<distro>-<major>" to (group name, manager, var file)"""
+    layout = {}
+    try:
+        managers = sorted(os.listdir(directory))
+    except OSError:
+        return layout
+    for manager in managers:
+        manager_directory = os.path.join(directory, manager)
+        if not os.path.isdir(manager_directory):
+            continue
+        for file in sorted(os.listdir(manager_directory)):
+            name, ext = os.path.splitext(file)
+            if ext in (".yml", ".yaml"):
+                layout[name.lower()] = (
+                    name,
+                    manager,
+                    os.path.join(os.path.basename(directory), manager, file),
+                )
+    return layout
+
+
+def bucket_name(distro, major) -> str:
+    # keep the Distro-major form of the var files, drop anything else
+    # ansible does not allow in a group name
+    return re.sub(r"[^A-Za-z0-9_-]", "_", "%s-%s" % (distro, major or "NA"))
+
+
+""" =========================================================
+Bucket the hosts of an os facts table
+
+Return Type: dict of group name -> {"hosts", "vars"}, plus a
+             dict of parent group (package manager, or no_os_vars)
+             -> list of group names
+============================================================="""
+
+
+def sort_hosts(table, layout) -> tuple:
+    managers_by_distro = {}
+    for name, manager, var_file in layout.values():
+        managers_by_distro.setdefault(name.rsplit("-", 1)[0].lower(), manager)
+
+    rows = table.select(status=SUCCESS) + table.select(status=CHANGED)
+    buckets = {}
+    managers = {}
+    for (distro, major), hosts in sorted(
+        table.group_by("distro", "major", rows=sorted(rows)).items()
+    ):
+        if not distro:
+            continue
+        major = major or "NA"
+        known = layout.get(("%s-%s" % (distro, major)).lower())
+        if known is not None:
+            (name, manager, var_file) = known
+        else:
+            name = bucket_name(distro, major)
+            manager = managers_by_distro.get(
+                distro.lower(), PACKAGE_MANAGERS.get(distro.lower(), UNKNOWN_MANAGER)
+            )
+            var_file = ""
+        group_vars = {
+            "os_distro": distro,
+            "os_major": major,
+            "package_manager": manager,
+        }
+        buckets[name] = {"hosts": sorted(hosts), "vars": group_vars}
+        if var_file:
+            group_vars["os_vars_file"] = var_file
+            managers.setdefault(manager, []).append(name)
+        else:
+            managers.setdefault(NO_VARS_GROUP, []).append(name)
+        if debug:
+            print("%s: %d hosts" % (name, len(hosts)))
+    return buckets, managers
+
+
+def format_os_inventory(buckets, managers) -> str:
+    lines = []
+    for name, bucket in sorted(buckets.items()):
+        lines.append("\n[%s]\n" % name)
+        lines.extend("%s\n" % host for host in bucket["hosts"])
+        lines.append("\n[%s:vars]\n" % name)
+        lines.extend("%s=%s\n" % item for item in sorted(bucket["vars"].items()))
+    for manager, names in sorted(managers.items()):
+        lines.append("\n[%s:children]\n" % manager)
+        lines.extend("%s\n" % name for name in sorted(names))
+    return "".join(lines)
+
+
+def format_report(table, buckets) -> str:
+    lines = []
+    for name, bucket in sorted(buckets.items()):
+        lines.append("%-20s %5d" % (name, len(bucket["hosts"])))
+    for status, count in sorted(table.counts("status").items()):
+        lines.append("%-20s %5d" % (status.lower(), count))
+    unreachable = table.select(status=UNREACHABLE)
+    for reason, count in sorted(table.counts("reason", unreachable).items()):
+        lines.append("  %s: %d" % (reason, count))
+    return "\n".join(lines) + "\n"
+
+
+# Define a main function
+def main():
+    parser = argparse.ArgumentParser(description="group hosts by os from os-data.json")
+    parser.add_argument("--input", default=os_data_file, help="ansible -m setup output")
+    parser.add_argument("--output", default=inventory_file, help="inventory to write")
+    parser.add_argument(
+        "--report", action="store_true", help="print host counts per group and status"
+    )
+    args = parser.parse_args()
+
+    # reuses os-data.table while os-data.json is unchanged
+    table_file = os_table_file if args.input == os_data_file else ""
+    table = load_os_data(args.input, table_file)
+    buckets, managers = sort_hosts(table, load_os_vars_layout(os_vars_directory))
+    write_file_atomic(args.output, format_os_inventory(buckets, managers))
+    if args.report:
+        print(format_report(table, buckets), end="")
+
+
+# Check if the script is run as the main module
+if __name__ == "__main__":
+    # Call the main function
+    main()
@@ -0,0 +1,72 @@
+import sys
+import time
+import tracemalloc
+
+from libhostinfo import CompactHostInfo, FrozenHostInfo, HostInfo
+from libinventoryinfo import CompactInventoryEntry, FrozenInventoryEntry, InventoryEntry
+
+""" =========================================================
+Memory benchmark: HostInfo/InventoryEntry vs the slotted,
+packed-ip variants, for N hosts with two ips each.
+
+usage: python bench_hostinfo.py [N]
+============================================================="""
+
+
+def iter_hosts(n):
+    for i in range(n):
+        yield HostInfo(
+            "host%06d.example.lan" % i,
+            ["10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255),
+             "192.168.%d.%d" % (i >> 8 & 255, i & 255)],
+            ["Fedora", "39"],
+            "Fedora",
+            "39",
+        )
+
+
+def plain_entry(host) -> InventoryEntry:
+    entry = InventoryEntry(
+        nipr_ip="",
+        dev_ip="",
+        stand_alone_ip="",
+        unknown_subnet_ip="",
+        old_stand_alone_ip="",
+        hostname="",
+        ip_list=[],
+        distro="",
+        release="",
+    )
+    entry.add_host(host)
+    return entry
+
+
+def measure(label, build, n):
+    # everything is built from scratch inside the window, so the
+    # hostname and ip strings each variant keeps are counted too
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = build(iter_hosts(n))
+    elapsed = time.perf_counter() - start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        "%-24s %10.1f MiB %8.0f bytes/host %8.2fs"
+        % (label, size / 2**20, size / n, elapsed)
+    )
+    return objects
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("%d hosts (time includes tracemalloc overhead)" % n)
+    measure("HostInfo", list, n)
+    measure("CompactHostInfo", lambda hs: [CompactHostInfo.from_host_info(h) for h in hs], n)
+    measure("FrozenHostInfo", lambda hs: [FrozenHostInfo.from_host_info(h) for h in hs], n)
+    measure("InventoryEntry", lambda hs: [plain_entry(h) for h in hs], n)
+    measure("CompactInventoryEntry", lambda hs: [CompactInventoryEntry.from_host(h) for h in hs], n)
+    measure("FrozenInventoryEntry", lambda hs: [FrozenInventoryEntry.from_host(h) for h in hs], n)
+
+
+if __name__ == "__main__":
+    main()
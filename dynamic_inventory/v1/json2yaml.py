@@ -3,6 +3,8 @@ import configparser
 import json
 import pathlib as p
 
+from libhostsjson import write_hosts_inventory
+
 debug = False
 
 json_file = "./hosts.json"
@@ -62,11 +64,12 @@ def main():
     # json_file = input("Enter the JSON file name: ") or "./hosts.json"
     # Get the INI file name from the user input or use the default
     # ini_file = input("Enter the INI file name: ") or "./hosts.ini"
-    # Call the load_json function and get the JSON data
-    json_data = load_json(json_file)
-    # Call the write_ini function and write the INI data to the file
-    write_inventory(json_data, inventory_file)
-    
+    # stream _meta.hostvars out of the export instead of loading it whole
+    write_hosts_inventory(json_file, inventory_file)
+    # create hosts directory
+    path = p.Path(hosts_directory)
+    if not path.exists(): path.mkdir()
+
     # Print a success message
     if debug: print(f"Successfully converted {json_file} to {inventory_file}")
 
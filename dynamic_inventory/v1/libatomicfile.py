@@ -0,0 +1,31 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+""" =========================================================
+Atomic file writes
+
+Everything is written to a temp file next to the target and
+renamed over it, so readers never see a half written file, and
+a failed write leaves the previous one in place.
+============================================================="""
+
+
+@contextmanager
+def atomic_open(file, mode="w", buffering=1 << 16):
+    """open a temp file that replaces file when the block exits cleanly"""
+    directory = os.path.dirname(os.path.abspath(file))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, buffering=buffering) as f:
+            yield f
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, file)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def write_file_atomic(file, content):
+    with atomic_open(file, "wb" if isinstance(content, bytes) else "w") as f:
+        f.write(content)
@@ -0,0 +1,160 @@
+import ast
+import json
+import os
+import re
+import threading
+
+from libatomicfile import atomic_open
+
+debug = False
+
+# only the first line of a fact file is read, and never more than this
+MAX_LINE = 65536
+
+""" =========================================================
+Safe loader for the host fact files written by gather_facts.yml
+
+content: "{{ ansible_fqdn, ansible_all_ipv4_addresses, [os_distro, os_version] }}"
+('localhost-live.maersk.homenet.lan', ['172.16.20.156', '172.16.30.161'], ['Fedora', '39'])
+
+Files are never eval()'d: the common single-quoted form is matched
+with a regex, anything else goes through ast.literal_eval, and the
+result has to have the shape above either way.
+============================================================="""
+
+_STR = r"'([^'\\]*)'"
+_LIST = r"\[\s*((?:'[^'\\]*'\s*,\s*)*(?:'[^'\\]*')?)\s*,?\s*\]"
+_FACTS_RE = re.compile(r"^\(\s*%s\s*,\s*%s\s*,\s*%s\s*,?\s*\)$" % (_STR, _LIST, _LIST))
+_ITEM_RE = re.compile(_STR)
+
+
+def parse_host_facts(line) -> tuple:
+    """parse one fact line into (fqdn, [ips], [distro, major])
+
+    Raises ValueError if the line is not in that format.
+    """
+    line = line.strip()
+    match = _FACTS_RE.match(line)
+    if match:
+        # the regex only checks the quoting, the shape is checked below
+        return check_host_facts(
+            (
+                match.group(1),
+                _ITEM_RE.findall(match.group(2)),
+                _ITEM_RE.findall(match.group(3)),
+            )
+        )
+
+    try:
+        res = ast.literal_eval(line)
+    except (SyntaxError, ValueError, MemoryError, RecursionError) as e:
+        raise ValueError("not a host fact tuple: %s" % e)
+    return check_host_facts(res)
+
+
+def check_host_facts(res) -> tuple:
+    if not isinstance(res, (tuple, list)) or len(res) != 3:
+        raise ValueError("expected (fqdn, [ips], [distro, major])")
+    fqdn, ip_list, os_info = res
+    if not isinstance(fqdn, str):
+        raise ValueError("fqdn is not a string")
+    if not isinstance(ip_list, (list, tuple)) or not all(
+        isinstance(ip, str) for ip in ip_list
+    ):
+        raise ValueError("ip list is not a list of strings")
+    if (
+        not isinstance(os_info, (list, tuple))
+        or len(os_info) < 2
+        or not all(isinstance(o, str) for o in os_info)
+    ):
+        raise ValueError("os info is not [distro, major]")
+    return (fqdn, list(ip_list), list(os_info))
+
+
+def read_host_facts(file) -> tuple:
+    """read and parse the first line of a fact file"""
+    with open(file, "r") as f:
+        line = f.readline(MAX_LINE)
+    if len(line) >= MAX_LINE:
+        raise ValueError("fact line longer than %d characters" % MAX_LINE)
+    return parse_host_facts(line)
+
+
+""" =========================================================
+Persistent index of parsed fact files
+
+Maps each file path to its (mtime, size) and parsed record, so
+a rerun only re-parses the files that changed. Entries for files
+that were not looked up during the run are dropped on save.
+
+The index is plain json, and every record read back from it goes
+through check_host_facts again, so a damaged or edited index can
+only cost a re-parse, never a bad record.
+============================================================="""
+
+
+class HostFactsIndex:
+    """Class for tracking parsed host fact files between runs"""
+
+    VERSION = 2
+
+    def __init__(self, index_file=""):
+        self.index_file = index_file
+        self.entries = {}
+        self.seen = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if index_file:
+            self.load()
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.index_file, "r") as f:
+                data = json.load(f)
+            if data.get("version") != self.VERSION:
+                return
+            for key, entry in data["entries"].items():
+                try:
+                    (stamp, record) = entry
+                    self.entries[key] = (tuple(stamp), check_host_facts(record))
+                except (TypeError, ValueError):
+                    continue
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            self.entries = {}
+        if debug:
+            print("loaded index entries: ", len(self.entries))
+
+    def lookup(self, file) -> tuple:
+        """return the parsed record for file, re-parsing it only if it changed"""
+        (key, stamp, record) = self.check(file)
+        if record is None:
+            record = read_host_facts(key)
+        self.store(key, stamp, record)
+        return record
+
+    def check(self, file) -> tuple:
+        """stat file and return (key, stamp, record), record is None if it changed"""
+        key = os.fspath(file)
+        st = os.stat(key)
+        stamp = (st.st_mtime_ns, st.st_size)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            with self.lock:
+                self.hits += 1
+            return (key, stamp, entry[1])
+        with self.lock:
+            self.misses += 1
+        return (key, stamp, None)
+
+    def store(self, key, stamp, record):
+        self.seen[key] = (stamp, record)
+
+    def save(self):
+        if not self.index_file:
+            return
+        with atomic_open(self.index_file) as f:
+            json.dump({"version": self.VERSION, "entries": self.seen}, f)
+        self.entries = self.seen
+        self.seen = {}
@@ -1,4 +1,5 @@
 import pathlib as p
+import socket
 from dataclasses import dataclass
 from typing import List
 
@@ -75,3 +76,132 @@ class HostInfo:
 # print (type(self.name))
 # <class 'str'>
 # Expected behavior <class datetime.datetime>
+
+
+""" =========================================================
+Compact host info
+
+IPv4 addresses are packed 4 bytes each into a single bytes
+object, and instances use __slots__, which cuts per-host memory
+to a fraction of HostInfo's when tracking 100k hosts.
+CompactHostInfo is mutable, FrozenHostInfo is hashable and
+raises dataclasses.FrozenInstanceError from its setters. Both
+keep HostInfo's getter/setter API, getters return strings.
+============================================================="""
+
+
+def ip_to_int(ip) -> int:
+    return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+
+
+def int_to_ip(value) -> str:
+    return socket.inet_ntoa(value.to_bytes(4, "big"))
+
+
+def pack_ips(ip_list) -> bytes:
+    return b"".join(socket.inet_pton(socket.AF_INET, ip) for ip in ip_list)
+
+
+def unpack_ips(packed) -> list:
+    return [socket.inet_ntoa(packed[i : i + 4]) for i in range(0, len(packed), 4)]
+
+
+class _CompactHostInfoMethods:
+    """HostInfo's accessors over packed ips and an os info tuple"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_host_info(cls, host):
+        return cls(
+            host.get_fqdn(),
+            pack_ips(host.get_ip_list()),
+            tuple(host.get_os_info_list()),
+            host.get_distro(),
+            host.get_version(),
+        )
+
+    def to_host_info(self) -> HostInfo:
+        return HostInfo(
+            self.name,
+            self.get_ip_list(),
+            self.get_os_info_list(),
+            self.os_distro,
+            self.os_distro_version_major,
+        )
+
+    def get_os_info_list(self) -> list:
+        return list(self.os_info)
+
+    def set_os_info_list(self, os_info):
+        self.os_info = tuple(os_info)
+
+    def get_fqdn(self) -> str:
+        return self.name
+
+    def set_fqdb(self, name):
+        self.name = name
+
+    def get_ip_list(self) -> list:
+        return unpack_ips(self.ips)
+
+    def set_ip_list(self, ip_list):
+        self.ips = pack_ips(ip_list)
+
+    def get_version(self) -> str:
+        return self.os_distro_version_major
+
+    def set_version(self, version):
+        os_info = list(self.os_info)
+        os_info[1] = version
+        self.os_info = tuple(os_info)
+        self.os_distro_version_major = version
+
+    def get_distro(self) -> str:
+        return self.os_distro
+
+    def set_distro(self, distro):
+        os_info = list(self.os_info)
+        os_info[0] = distro
+        self.os_info = tuple(os_info)
+        self.os_distro = distro
+
+    def set_os_info(self, os_info=[]):
+        # verify we have at least, an os family
+        if len(os_info) > 0:
+            self.set_os_info_list(os_info)
+            self.set_distro(os_info[0])
+            if len(os_info) > 1:
+                self.set_version(os_info[1])
+
+    def get_os_info_tuple(self) -> tuple:
+        return (self.get_os_info_list(), self.get_distro(), self.get_version())
+
+    def add_ip(self, ip):
+        self.ips += socket.inet_pton(socket.AF_INET, ip)
+
+
+@dataclass
+class CompactHostInfo(_CompactHostInfoMethods):
+    """Class for tracking host info, slotted with packed ips"""
+
+    __slots__ = ("name", "ips", "os_info", "os_distro", "os_distro_version_major")
+
+    name: str
+    ips: bytes
+    os_info: tuple
+    os_distro: str
+    os_distro_version_major: str
+
+
+@dataclass(frozen=True)
+class FrozenHostInfo(_CompactHostInfoMethods):
+    """Class for tracking host info, slotted with packed ips and read only"""
+
+    __slots__ = ("name", "ips", "os_info", "os_distro", "os_distro_version_major")
+
+    name: str
+    ips: bytes
+    os_info: tuple
+    os_distro: str
+    os_distro_version_major: str
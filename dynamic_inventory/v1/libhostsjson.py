@@ -0,0 +1,202 @@
+import json
+import re
+import tempfile
+
+""" =========================================================
+Streaming reader for the hosts.json nmap export
+
+  ansible-inventory -i nmap.yaml --export --output=hosts.json --list
+
+Walks _meta.hostvars one host at a time instead of json.load()ing
+the whole export, wherever _meta sits in the document. Every other
+top level value (all, ungrouped, ...) is skipped by scanning for
+its closing bracket without being decoded, so memory stays at one
+read chunk plus one host entry no matter how many hosts there are.
+============================================================="""
+
+CHUNK_SIZE = 65536
+
+_STRUCT_RE = re.compile(r'[\[\]{}"]')
+# the longest run of string content, stopping before the closing quote
+_STRING_BODY_RE = re.compile(r'(?:[^"\\]|\\.)*', re.S)
+
+
+class HostsJsonReader:
+    """Class for reading _meta.hostvars out of an inventory export"""
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        # start of the value being read, which fill() must not drop
+        self.start = None
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        keep = self.pos if self.start is None else self.start
+        if keep > len(self.buf) // 2:
+            self.buf = self.buf[keep:]
+            self.pos -= keep
+            if self.start is not None:
+                self.start = 0
+        size = CHUNK_SIZE
+        if self.start is not None:
+            # a value that outgrows the chunk doubles the read size, so
+            # growing the buffer to hold it stays linear
+            size = max(size, len(self.buf) - self.start)
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+        self.buf += chunk
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("expected one of %r but found %r" % (chars, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        """decode the next json value
+
+        A value longer than the buffer is only retried once the buffer
+        has doubled (fill() grows its reads to match), so it is decoded
+        a few times in all rather than once per chunk.
+        """
+        self.peek()
+        self.start = self.pos
+        tried = 0
+        try:
+            while True:
+                pending = len(self.buf) - self.pos
+                if self.eof or pending >= 2 * tried:
+                    tried = pending
+                    try:
+                        (value, end) = self.decoder.raw_decode(self.buf, self.pos)
+                        # numbers have no terminator, so one ending at the end
+                        # of the buffer is only complete at the end of the file
+                        if end < len(self.buf) or self.eof:
+                            self.pos = end
+                            return value
+                    except ValueError:
+                        if self.eof:
+                            raise
+                self.fill()
+        finally:
+            self.start = None
+
+    def skip(self):
+        """step over the next json value without decoding it"""
+        c = self.peek()
+        if c == '"':
+            self.pos += 1
+            self.skip_string()
+            return
+        if c not in "{[":
+            self.value()
+            return
+        depth = 0
+        while True:
+            match = _STRUCT_RE.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    raise ValueError("unexpected end of json")
+                continue
+            self.pos = match.end()
+            c = match.group()
+            if c == '"':
+                self.skip_string()
+            elif c in "{[":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def skip_string(self):
+        # self.pos is just past the opening quote; each fill() resumes
+        # where the last scan stopped, before any dangling backslash
+        while True:
+            self.pos = _STRING_BODY_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) and self.buf[self.pos] == '"':
+                self.pos += 1
+                return
+            if not self.fill():
+                raise ValueError("unterminated json string")
+
+    def members(self):
+        """yield each key of an object, with the reader left on its value"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                self.expect('"')
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def hostvars(self):
+        """yield (host, vars) for each entry of _meta.hostvars, in file order"""
+        for key in self.members():
+            if key != "_meta" or self.peek() != "{":
+                self.skip()
+                continue
+            for meta_key in self.members():
+                if meta_key != "hostvars" or self.peek() != "{":
+                    self.skip()
+                    continue
+                for host in self.members():
+                    yield (host, self.value())
+
+
+def iter_hostvars(file):
+    with open(file, "r") as f:
+        yield from HostsJsonReader(f).hostvars()
+
+
+""" =========================================================
+Write the nmap inventory from a hosts.json export:
+  - one [name] section with its ip for every host nmap found
+    a name for (ip != name)
+  - every ip under [devices]
+
+The [devices] ips are spooled to a temporary file while the named
+sections are written, then appended, so the output matches the old
+json.load() based writers line for line. on_device, if given, is
+called with the hostvars of every host that got a [name] section.
+============================================================="""
+
+
+def write_hosts_inventory(json_file, inventory_file, on_device=None):
+    with open(inventory_file, "w") as f, tempfile.TemporaryFile("w+") as ips:
+        for host, curdict in iter_hostvars(json_file):
+            # only configure for host entry if there's a host name to work with.
+            if curdict["ip"] != curdict["name"]:
+                f.write("\n[%s]\n" % curdict["name"])
+                f.write("%s\n" % curdict["ip"])
+                if on_device is not None:
+                    on_device(curdict)
+            ips.write("%s\n" % curdict["ip"])
+        # write out all ip's to their own section
+        f.write("\n[devices]\n")
+        ips.seek(0)
+        for line in ips:
+            f.write(line)
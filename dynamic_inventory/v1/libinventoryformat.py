@@ -0,0 +1,155 @@
+import ast
+import json
+import re
+
+import libinventoryinfo
+
+""" =========================================================
+Single file inventory output
+
+Turns an Inventory into the structure `ansible-inventory --list`
+prints, in one pass over its entries:
+  - one group per distro/release, e.g. Fedora_39, as a child
+    of its distro group, e.g. Fedora
+  - one group per subnet (dev, nipr, standalone, old_standalone,
+    unknown, or a custom subnets.ini group)
+  - _meta.hostvars with ansible_host (the stand alone ip, as in
+    the per-release files, else the first ip), ip_list,
+    os_distro and os_distro_version_major
+
+That structure is then written out as INI, YAML or JSON. The JSON
+carries _meta.hostvars, so fast_script never has to call --host.
+============================================================="""
+
+# subnet group -> section name used in the subnet inventory file
+SUBNET_GROUPS = {
+    "stand_alone": "standalone",
+    "old_stand_alone": "old_standalone",
+}
+
+
+def group_name(name) -> str:
+    # ansible group names are restricted to letters, digits and _
+    return re.sub(r"[^A-Za-z0-9_]", "_", name) or "_"
+
+
+def build_model(inventory) -> dict:
+    groups = {}
+    hostvars = {}
+    classifier = libinventoryinfo.subnet_classifier
+
+    def group(name):
+        return groups.setdefault(name, {"hosts": [], "children": []})
+
+    for entry in inventory.get_inventory_entries():
+        host = entry.get_host_name()
+        ip_list = entry.get_ip_list()
+        distro = group_name(entry.get_distro())
+        release = group_name("%s_%s" % (entry.get_distro(), entry.get_release()))
+
+        group(release)["hosts"].append(host)
+        if release not in group(distro)["children"]:
+            group(distro)["children"].append(release)
+        for ip in ip_list:
+            subnet = classifier.classify(ip)
+            members = group(group_name(SUBNET_GROUPS.get(subnet, subnet)))["hosts"]
+            if not members or members[-1] != host:
+                members.append(host)
+
+        hostvars[host] = {
+            "ansible_host": entry.get_stand_alone_ip() or (ip_list[0] if ip_list else host),
+            "ip_list": list(ip_list),
+            "os_distro": entry.get_distro(),
+            "os_distro_version_major": entry.get_release(),
+        }
+
+    model = {"all": {"children": sorted(groups)}}
+    for name in sorted(groups):
+        data = {}
+        if groups[name]["hosts"]:
+            data["hosts"] = groups[name]["hosts"]
+        if groups[name]["children"]:
+            data["children"] = groups[name]["children"]
+        model[name] = data
+    model["_meta"] = {"hostvars": hostvars}
+    return model
+
+
+def format_json(model) -> str:
+    return json.dumps(model, indent=2, sort_keys=True) + "\n"
+
+
+def format_yaml(model) -> str:
+    # plain block yaml; scalars are json strings, which yaml reads as
+    # double quoted strings, so no yaml library is needed
+    hostvars = model["_meta"]["hostvars"]
+    lines = ["all:", "  children:"]
+    for name in model["all"]["children"]:
+        data = model[name]
+        lines.append("    %s:" % name)
+        if data.get("hosts"):
+            lines.append("      hosts:")
+            for host in data["hosts"]:
+                lines.append("        %s: {}" % json.dumps(host))
+        if data.get("children"):
+            lines.append("      children:")
+            for child in data["children"]:
+                lines.append("        %s: {}" % child)
+    # host vars are set once, under all.hosts
+    lines.append("  hosts:")
+    for host in sorted(hostvars):
+        lines.append("    %s:" % json.dumps(host))
+        for key, value in sorted(hostvars[host].items()):
+            lines.append("      %s: %s" % (key, json.dumps(value)))
+    return "\n".join(lines) + "\n"
+
+
+def format_ini(model) -> str:
+    hostvars = model["_meta"]["hostvars"]
+    lines = []
+    for name in model["all"]["children"]:
+        data = model[name]
+        if data.get("hosts"):
+            lines.append("\n[%s]" % name)
+            lines.extend(data["hosts"])
+        if data.get("children"):
+            lines.append("\n[%s:children]" % name)
+            lines.extend(data["children"])
+    # host vars are set once, on each host's line under [all]
+    lines.append("\n[all]")
+    for host in sorted(hostvars):
+        lines.append(
+            " ".join(
+                [host]
+                + [
+                    "%s=%s" % (key, _ini_value(value))
+                    for key, value in sorted(hostvars[host].items())
+                ]
+            )
+        )
+    return "\n".join(lines).lstrip("\n") + "\n"
+
+
+def _ini_value(value) -> str:
+    # ansible shlex splits the line, then literal_evals each value, so
+    # anything but a plain word that stays a string is single quoted json
+    if isinstance(value, str) and re.match(r"^[A-Za-z0-9_.:-]+$", value):
+        try:
+            ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value
+    return "'%s'" % json.dumps(value, separators=(",", ":"))
+
+
+FORMATS = {
+    "ini": format_ini,
+    "yaml": format_yaml,
+    "json": format_json,
+}
+
+
+def format_inventory(inventory, fmt) -> str:
+    """serialize an Inventory as one of FORMATS"""
+    if fmt not in FORMATS:
+        raise ValueError("unknown inventory format: %s" % fmt)
+    return FORMATS[fmt](build_model(inventory))
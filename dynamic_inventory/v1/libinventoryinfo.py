@@ -1,11 +1,30 @@
 from dataclasses import dataclass
 from typing import List
 
-from libhostinfo import HostInfo
+from libhostinfo import HostInfo, int_to_ip, ip_to_int, pack_ips, unpack_ips
+from libsubnet import SubnetClassifier, classify_array, ips_to_ints, np
 from typing_extensions import Iterator
 
 debug = False
 
+# classifies ips into the subnet lists below, see libsubnet
+subnet_classifier = SubnetClassifier()
+
+
+def set_subnet_classifier(classifier):
+    global subnet_classifier
+    subnet_classifier = classifier
+
+
+# subnet group name -> InventoryEntry field
+ENTRY_SUBNET_FIELDS = {
+    "dev": "dev_ip",
+    "stand_alone": "stand_alone_ip",
+    "nipr": "nipr_ip",
+    "old_stand_alone": "old_stand_alone_ip",
+}
+
+
 """ =========================================================
 Dataclass for holding ansible inventory info:
   - list of all nipr ips
@@ -96,21 +115,166 @@ class InventoryEntry:
             print("parsing: ", self.get_host_name())
         if debug:
             print("inv_entry_ip_switch", ip)
-        octets = ip.split(".")
-        if debug:
-            print("switching on ", octets[0])
-        if octets[0] == "192":
-            self.set_dev_ip(ip)
-        elif octets[0] == "10":
-            self.set_stand_alone_ip(ip)
-        elif octets[0] == "131":
-            self.set_nipr_ip(ip)
-        elif octets[0] == "137":
-            self.set_old_stand_alone_ip(ip)
-        else:
-            self.set_unknown_ip(ip)
-            if debug:
-                print("found unknown inside inv_entry: ", self.get_unknown_ip())
+        # groups without a field of their own count as unknown
+        field = ENTRY_SUBNET_FIELDS.get(subnet_classifier.classify(ip), "unknown_subnet_ip")
+        setattr(self, field, ip)
+        if debug and field == "unknown_subnet_ip":
+            print("found unknown inside inv_entry: ", self.get_unknown_ip())
+
+
+""" =========================================================
+Compact inventory entry
+
+Slotted counterpart of InventoryEntry: the per-subnet ips are
+kept as integers (0 when unset) and the ip list packed 4 bytes
+per address. Getters return the same strings InventoryEntry does.
+CompactInventoryEntry is mutable, FrozenInventoryEntry is
+built in one go with from_host() and is read only.
+============================================================="""
+
+
+def _subnet_fields(ip_list) -> dict:
+    # same classification as InventoryEntry.record_subnet, last ip wins
+    fields = {}
+    for ip, group in zip(ip_list, subnet_classifier.classify_many(ip_list)):
+        fields[ENTRY_SUBNET_FIELDS.get(group, "unknown_subnet_ip")] = ip
+    return fields
+
+
+class _CompactInventoryEntryMethods:
+    """InventoryEntry's accessors over integer ips"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_host(cls, host):
+        packed = pack_ips(host.get_ip_list())
+        ints = [int.from_bytes(packed[i : i + 4], "big") for i in range(0, len(packed), 4)]
+        fields = dict(
+            nipr_ip=0,
+            dev_ip=0,
+            stand_alone_ip=0,
+            unknown_subnet_ip=0,
+            old_stand_alone_ip=0,
+        )
+        fields.update(_subnet_fields(ints))
+        return cls(
+            hostname=host.get_fqdn(),
+            ip_list=packed,
+            distro=host.get_distro(),
+            release=host.get_version(),
+            **fields
+        )
+
+    def get_distro(self) -> str:
+        return self.distro
+
+    def set_distro(self, d):
+        self.distro = d
+
+    def get_release(self) -> str:
+        return self.release
+
+    def set_release(self, r):
+        self.release = r
+
+    def get_nipr_ip(self) -> str:
+        return int_to_ip(self.nipr_ip) if self.nipr_ip else ""
+
+    def set_nipr_ip(self, ip):
+        self.nipr_ip = ip_to_int(ip) if ip else 0
+
+    def get_dev_ip(self) -> str:
+        return int_to_ip(self.dev_ip) if self.dev_ip else ""
+
+    def set_dev_ip(self, ip):
+        self.dev_ip = ip_to_int(ip) if ip else 0
+
+    def get_old_stand_alone_ip(self) -> str:
+        return int_to_ip(self.old_stand_alone_ip) if self.old_stand_alone_ip else ""
+
+    def set_old_stand_alone_ip(self, ip):
+        self.old_stand_alone_ip = ip_to_int(ip) if ip else 0
+
+    def get_stand_alone_ip(self) -> str:
+        return int_to_ip(self.stand_alone_ip) if self.stand_alone_ip else ""
+
+    def set_stand_alone_ip(self, ip):
+        self.stand_alone_ip = ip_to_int(ip) if ip else 0
+
+    def get_unknown_ip(self) -> str:
+        return int_to_ip(self.unknown_subnet_ip) if self.unknown_subnet_ip else ""
+
+    def set_unknown_ip(self, ip):
+        self.unknown_subnet_ip = ip_to_int(ip) if ip else 0
+
+    def get_host_name(self) -> str:
+        return self.hostname
+
+    def set_host_name(self, hn):
+        self.hostname = hn
+
+    def get_ip_list(self) -> list:
+        return unpack_ips(self.ip_list)
+
+    def add_host(self, host):
+        self.set_host_name(host.get_fqdn())
+        for h in host.get_ip_list():
+            self.ip_list += pack_ips([h])
+            self.record_subnet(h)
+        self.set_release(host.get_version())
+        self.set_distro(host.get_distro())
+
+    def record_subnet(self, ip):
+        for name, value in _subnet_fields([ip_to_int(ip)]).items():
+            setattr(self, name, value)
+
+
+_ENTRY_SLOTS = (
+    "nipr_ip",
+    "dev_ip",
+    "stand_alone_ip",
+    "unknown_subnet_ip",
+    "old_stand_alone_ip",
+    "hostname",
+    "ip_list",
+    "distro",
+    "release",
+)
+
+
+@dataclass
+class CompactInventoryEntry(_CompactInventoryEntryMethods):
+    """Class for tracking inventory entry info, slotted with integer ips"""
+
+    __slots__ = _ENTRY_SLOTS
+
+    nipr_ip: int
+    dev_ip: int
+    stand_alone_ip: int
+    unknown_subnet_ip: int
+    old_stand_alone_ip: int
+    hostname: str
+    ip_list: bytes
+    distro: str
+    release: str
+
+
+@dataclass(frozen=True)
+class FrozenInventoryEntry(_CompactInventoryEntryMethods):
+    """Class for tracking inventory entry info, slotted with integer ips and read only"""
+
+    __slots__ = _ENTRY_SLOTS
+
+    nipr_ip: int
+    dev_ip: int
+    stand_alone_ip: int
+    unknown_subnet_ip: int
+    old_stand_alone_ip: int
+    hostname: str
+    ip_list: bytes
+    distro: str
+    release: str
 
 
 @dataclass
@@ -204,16 +368,47 @@ class Inventory:
         except StopIteration:
             pass
 
+    def add_ips_bulk(self, ip_list=[]):
+        """add a whole list of ips at once, same result as add_ip
+
+        The list is converted to integers in one go and classified
+        against the subnet table as an array, then each subnet list
+        is extended once. Uses numpy when it is installed.
+        """
+        if not type(ip_list) is list:
+            ip_list = list(ip_list)
+        if not ip_list:
+            return
+        values, valid = ips_to_ints(ip_list)
+        if np is not None:
+            labels, names = classify_array(subnet_classifier, values, valid)
+            ips = np.array(ip_list, dtype=object)
+            for label, name in enumerate(names):
+                mask = labels == label
+                if mask.any():
+                    self.subnet_list(name).extend(ips[mask].tolist())
+        else:
+            groups = subnet_classifier.classify_many(values)
+            by_group = {}
+            for ip, group, ok in zip(ip_list, groups, valid):
+                by_group.setdefault(group if ok else subnet_classifier.default, []).append(ip)
+            for name, ips in by_group.items():
+                self.subnet_list(name).extend(ips)
+
     def find_subnet(self, ip) -> list:
-        octets = ip.split(".")
-        if octets[0] == "192":
+        return self.subnet_list(subnet_classifier.classify(ip))
+
+    def subnet_list(self, group) -> list:
+        if group == "dev":
             return self.get_dev_ip_list()
-        elif octets[0] == "10":
+        elif group == "stand_alone":
             return self.get_stand_alone_ip_list()
-        elif octets[0] == "137":
+        elif group == "old_stand_alone":
             return self.get_old_stand_alone_ip_list()
-        elif octets[0] == "131":
+        elif group == "nipr":
             return self.get_nipr_ip_list()
-        else:
+        elif group == "unknown":
             return self.get_unknown_ip_list()
-
+        else:
+            # configured groups without a list of their own
+            return self.get_dict_unknown_subnet().setdefault(group, [])
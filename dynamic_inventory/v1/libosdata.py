@@ -0,0 +1,259 @@
+import json
+import os
+import re
+from array import array
+
+from libatomicfile import atomic_open
+
+debug = False
+
+""" =========================================================
+Parser for the ad-hoc setup output written by run.sh
+
+  ansible all -m setup -a 'filter=ansible_distribution*' > os-data.json
+
+which is not json, but one block per host:
+
+  172.16.30.70 | SUCCESS => {
+      "ansible_facts": {
+          "ansible_distribution": "Archlinux",
+          "ansible_distribution_major_version": "NA",
+          ...
+      },
+      "changed": false
+  }
+  172.16.0.93 | UNREACHABLE! => {
+      "changed": false,
+      "msg": "... over ssh: ssh: connect to host 172.16.0.93 port 22: Connection refused\r\n",
+      "unreachable": true
+  }
+
+The file is read line by line, only one host block is held at a
+time, and anything between blocks (warnings, deprecation notes)
+is skipped.
+============================================================="""
+
+SUCCESS = "SUCCESS"
+CHANGED = "CHANGED"
+UNREACHABLE = "UNREACHABLE"
+FAILED = "FAILED"
+
+STATUSES = (SUCCESS, CHANGED, UNREACHABLE, FAILED)
+
+_HEADER_RE = re.compile(r"^(\S+) \| (SUCCESS|CHANGED|UNREACHABLE|FAILED)!? => \{\s*$")
+# "... over ssh: nzeer@172.16.0.11: Permission denied (publickey,password)."
+_SSH_REASON_RE = re.compile(r": ([^:]+?)\.?$")
+
+
+def iter_os_data(file):
+    """yield (host, status, result dict) for each host block, in file order"""
+    with open(file, "r") as f:
+        host = None
+        body = []
+        for line in f:
+            if host is None:
+                match = _HEADER_RE.match(line)
+                if match:
+                    host, status = match.groups()
+                    body = ["{"]
+                continue
+            if line.rstrip() != "}":
+                body.append(line)
+                continue
+            body.append("}")
+            try:
+                result = json.loads("".join(body))
+            except ValueError as e:
+                result = {"msg": "unparsable result: %s" % e}
+            yield (host, status, result)
+            host = None
+        if host is not None:
+            yield (host, status, {"msg": "truncated result"})
+
+
+def failure_reason(status, result) -> str:
+    msg = result.get("msg", "")
+    if not isinstance(msg, str):
+        msg = json.dumps(msg)
+    lines = msg.strip().splitlines()
+    if not lines:
+        return ""
+    if status == UNREACHABLE:
+        # keep the ssh error, drop the boilerplate before it
+        match = _SSH_REASON_RE.search(lines[0].strip())
+        if match:
+            return match.group(1)
+    return lines[0].strip()
+
+
+""" =========================================================
+Columnar store of per host os facts
+
+One row per host block, with the columns:
+  host, status, distro, major, version, reason
+
+Apart from host, every column is an array of 32 bit integer codes
+into one shared string pool (code 0 is ""), so a table of the whole
+network stays a handful of compact arrays, and select/group_by
+compare integers instead of strings. Tables are saved as json next
+to the source file, stamped with its mtime and size, so later steps
+query the saved table instead of re-parsing os-data.json; a saved
+table that does not hold together is parsed again, never trusted.
+============================================================="""
+
+COLUMNS = ("host", "status", "distro", "major", "version", "reason")
+
+
+class OsDataTable:
+    """Class for holding parsed os facts, one column per field"""
+
+    VERSION = 3
+
+    # 32 bit codes: failure reasons can be unique per host, so a large
+    # network can pool more than the 65535 strings a 16 bit code allows
+    TYPECODE = "I"
+
+    def __init__(self):
+        self.hosts = []
+        self.codes = {name: array(self.TYPECODE) for name in COLUMNS[1:]}
+        self.pool = [""]
+        self.pool_index = {"": 0}
+
+    def __len__(self) -> int:
+        return len(self.hosts)
+
+    def encode(self, value) -> int:
+        code = self.pool_index.get(value)
+        if code is None:
+            code = len(self.pool)
+            self.pool.append(value)
+            self.pool_index[value] = code
+        return code
+
+    def add(self, host, status, distro="", major="", version="", reason=""):
+        self.hosts.append(host)
+        for name, value in (
+            ("status", status),
+            ("distro", distro),
+            ("major", major),
+            ("version", version),
+            ("reason", reason),
+        ):
+            self.codes[name].append(self.encode(value))
+
+    def add_result(self, host, status, result):
+        facts = result.get("ansible_facts") or {}
+        if status in (SUCCESS, CHANGED) and facts:
+            self.add(
+                host,
+                status,
+                str(facts.get("ansible_distribution", "")),
+                str(facts.get("ansible_distribution_major_version", "")),
+                str(facts.get("ansible_distribution_version", "")),
+            )
+        else:
+            self.add(host, status, reason=failure_reason(status, result))
+
+    def value(self, name, row) -> str:
+        if name == "host":
+            return self.hosts[row]
+        return self.pool[self.codes[name][row]]
+
+    def column(self, name, rows=None) -> list:
+        if name == "host":
+            values = self.hosts
+            return list(values) if rows is None else [values[i] for i in rows]
+        pool = self.pool
+        codes = self.codes[name]
+        if rows is None:
+            return [pool[c] for c in codes]
+        return [pool[codes[i]] for i in rows]
+
+    def select(self, **conditions) -> list:
+        """row numbers whose columns equal all of conditions, e.g. status="SUCCESS" """
+        rows = range(len(self.hosts))
+        for name, value in conditions.items():
+            code = self.pool_index.get(value)
+            if code is None:
+                return []
+            codes = self.codes[name]
+            rows = [i for i in rows if codes[i] == code]
+        return list(rows)
+
+    def group_by(self, *names, rows=None) -> dict:
+        """map each distinct tuple of column values to the hosts that have it"""
+        if rows is None:
+            rows = range(len(self.hosts))
+        columns = [self.codes[name] for name in names]
+        groups = {}
+        for i in rows:
+            groups.setdefault(tuple(c[i] for c in columns), []).append(self.hosts[i])
+        pool = self.pool
+        return {tuple(pool[c] for c in key): hosts for key, hosts in groups.items()}
+
+    def counts(self, name, rows=None) -> dict:
+        counts = {}
+        for value in self.column(name, rows):
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def save(self, table_file, stamp=None):
+        with atomic_open(table_file) as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "stamp": stamp,
+                    "hosts": self.hosts,
+                    "codes": {k: v.tolist() for k, v in self.codes.items()},
+                    "pool": self.pool,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, table_file, stamp=None):
+        """return the saved table, or None if it is missing, stale or unreadable"""
+        try:
+            with open(table_file, "r") as f:
+                data = json.load(f)
+            if data.get("version") != cls.VERSION:
+                return None
+            if data.get("stamp") != (None if stamp is None else list(stamp)):
+                return None
+            table = cls()
+            table.hosts = [str(host) for host in data["hosts"]]
+            table.pool = [str(value) for value in data["pool"]]
+            for name in COLUMNS[1:]:
+                codes = array(cls.TYPECODE, data["codes"][name])
+                if len(codes) != len(table.hosts) or (
+                    codes and max(codes) >= len(table.pool)
+                ):
+                    return None
+                table.codes[name] = codes
+            table.pool_index = {value: code for code, value in enumerate(table.pool)}
+        except (OSError, ValueError, TypeError, KeyError, AttributeError, OverflowError):
+            return None
+        return table
+
+
+def parse_os_data(file) -> OsDataTable:
+    table = OsDataTable()
+    for host, status, result in iter_os_data(file):
+        table.add_result(host, status, result)
+    return table
+
+
+def load_os_data(file, table_file="") -> OsDataTable:
+    """parse file, or reuse table_file if it was saved from the same file"""
+    st = os.stat(file)
+    stamp = (os.path.abspath(file), st.st_mtime_ns, st.st_size)
+    if table_file:
+        table = OsDataTable.load(table_file, stamp)
+        if table is not None:
+            if debug:
+                print("using saved table: ", table_file)
+            return table
+    table = parse_os_data(file)
+    if table_file:
+        table.save(table_file, stamp)
+    return table
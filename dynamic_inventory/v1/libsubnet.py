@@ -0,0 +1,146 @@
+import configparser
+import ipaddress
+import socket
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+""" =========================================================
+CIDR based subnet classifier
+
+Maps CIDR blocks to inventory group names with longest prefix
+match over integer addresses. Blocks are kept in one dict per
+prefix length, keyed by the network bits, and looked up from the
+longest prefix down, so classifying an address costs one shift
+and one dict lookup per distinct prefix length in the config.
+
+The default config is the old first octet switch:
+  192.x -> dev, 10.x -> stand_alone, 131.x -> nipr,
+  137.x -> old_stand_alone, anything else -> unknown
+============================================================="""
+
+DEFAULT_SUBNETS = {
+    "192.0.0.0/8": "dev",
+    "10.0.0.0/8": "stand_alone",
+    "131.0.0.0/8": "nipr",
+    "137.0.0.0/8": "old_stand_alone",
+}
+
+UNKNOWN = "unknown"
+
+
+class SubnetClassifier:
+    """Class for classifying ipv4 addresses by CIDR block"""
+
+    def __init__(self, subnets=None, default=UNKNOWN):
+        self.default = default
+        # (shift, {network >> shift: name}), longest prefix first
+        self.tables = []
+        if subnets is None:
+            subnets = DEFAULT_SUBNETS
+        for cidr, name in subnets.items():
+            self.add(cidr, name)
+
+    def add(self, cidr, name):
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        shift = 32 - network.prefixlen
+        for table_shift, table in self.tables:
+            if table_shift == shift:
+                break
+        else:
+            table = {}
+            self.tables.append((shift, table))
+            self.tables.sort(key=lambda t: t[0])
+        table[int(network.network_address) >> shift] = name
+
+    def classify_int(self, ip) -> str:
+        for shift, table in self.tables:
+            name = table.get(ip >> shift)
+            if name is not None:
+                return name
+        return self.default
+
+    def classify(self, ip) -> str:
+        try:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+        except (OSError, TypeError):
+            return self.default
+        return self.classify_int(value)
+
+    def classify_many(self, ips) -> list:
+        """classify a list of integer addresses"""
+        if len(self.tables) == 1:
+            shift, table = self.tables[0]
+            get = table.get
+            default = self.default
+            return [get(ip >> shift, default) for ip in ips]
+        classify_int = self.classify_int
+        return [classify_int(ip) for ip in ips]
+
+
+def ips_to_ints(ip_list) -> tuple:
+    """convert ipv4 strings to integers in one pass
+
+    Returns (values, valid): values holds 0 for anything that is not
+    an ipv4 address, and valid marks which entries were. With numpy
+    both are arrays, built from a single packed buffer, otherwise lists.
+    """
+    pton = socket.inet_pton
+    af = socket.AF_INET
+    zero = b"\0\0\0\0"
+    packed = []
+    valid = []
+    for ip in ip_list:
+        try:
+            packed.append(pton(af, ip))
+            valid.append(True)
+        except (OSError, TypeError):
+            packed.append(zero)
+            valid.append(False)
+    if np is not None:
+        values = np.frombuffer(b"".join(packed), dtype=">u4").astype(np.uint32)
+        return values, np.array(valid, dtype=bool)
+    return [int.from_bytes(b, "big") for b in packed], valid
+
+
+def classify_array(classifier, values, valid=None) -> tuple:
+    """classify a numpy array of integer addresses by masking
+
+    Returns (labels, names): labels[i] is the index into names of
+    the group of values[i]. Each prefix length is matched with one
+    sorted search over the whole array, longest prefix first.
+    """
+    names = [classifier.default]
+    name_index = {classifier.default: 0}
+    labels = np.zeros(len(values), dtype=np.int32)
+    pending = np.ones(len(values), dtype=bool) if valid is None else valid.copy()
+    for shift, table in classifier.tables:
+        if not pending.any():
+            break
+        keys = np.array(sorted(table), dtype=np.uint64)
+        groups = []
+        for key in sorted(table):
+            name = table[key]
+            if name not in name_index:
+                name_index[name] = len(names)
+                names.append(name)
+            groups.append(name_index[name])
+        groups = np.array(groups, dtype=np.int32)
+        prefixes = values.astype(np.uint64) >> np.uint64(shift)
+        pos = np.searchsorted(keys, prefixes)
+        pos[pos == len(keys)] = 0
+        hit = pending & (keys[pos] == prefixes)
+        labels[hit] = groups[pos[hit]]
+        pending &= ~hit
+    return labels, names
+
+
+def load_subnets(config_file, section="SUBNETS") -> dict:
+    """read "cidr = group" lines from a section of an ini file"""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    if not config.has_section(section):
+        return dict(DEFAULT_SUBNETS)
+    return dict(config.items(section))
@@ -1,8 +1,16 @@
+import argparse
+import hashlib
+import json
 import os
-import pathlib as p
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+from libatomicfile import write_file_atomic
+from libhostfacts import HostFactsIndex, read_host_facts
 from libhostinfo import HostInfo
-from libinventoryinfo import Inventory, InventoryEntry
+from libinventoryformat import FORMATS, format_inventory
+from libinventoryinfo import Inventory, InventoryEntry, set_subnet_classifier
+from libsubnet import SubnetClassifier, load_subnets
 
 # print debug messages to the console at runtime
 debug = False
@@ -16,61 +24,118 @@ parse files in ./hosts and build inventories based off:
 
 
 """ =========================================================
-load host data into HostInfo instance
+Load all hosts in a given directory
 
-Return Type: HostInfo
+ReturnType: list of HostInfo objects
 ============================================================="""
 
 
-def load_host(file):
-    current_host = HostInfo("", [], [], "", "")
-    if debug:
-        print("reading file:", file)
-    try:
-        path = p.Path(file)
-        if not path.exists():
-            raise RuntimeError("file does not exist.")
-        else:
-            # Open the file and read the tuple
-            # current_host.name, current_host.ip_list, current_host.os_info_list =
-            res = eval(
-                open(
-                    file,
-                ).readline()
-            )
-            if debug:
-                print("loading host: ", res)
-            return HostInfo(res[0], res[1], res[2], res[2][0], res[2][1])
-    except OSError as e:
-        print(e.strerror)
-    return current_host
+def load_hosts(directory, index_file="", workers=8, use_processes=False):
+    loaded_hosts, errors = load_hosts_concurrent(
+        directory, index_file, workers, use_processes
+    )
+    for file, error in errors:
+        print("%s: %s" % (file, error))
+    return loaded_hosts
 
 
 """ =========================================================
-Load all hosts in a given directory
-
-ReturnType: list of HostInfo objects
+Load all hosts in a given directory concurrently
+
+Files are stat'ed and checked against the index on a thread pool,
+since on network filesystems the time goes to stat/open latency.
+Files that changed are then parsed on the same threads, or on a
+process pool if use_processes is set. Hosts come back in natural
+file name order, numbers compared as numbers (192.168.1.2 before
+192.168.1.10), so every inventory file lists them the same way
+from run to run; unreadable or malformed files are skipped and reported
+in the error list instead.
+
+ReturnType: (list of HostInfo objects, list of (file, error))
 ============================================================="""
 
 
-def load_hosts(directory):
+def load_hosts_concurrent(directory, index_file="", workers=8, use_processes=False):
     if debug:
         print("Using directory: ", directory)
+    errors = []
+    index = HostFactsIndex(index_file)
+    try:
+        with os.scandir(directory) as it:
+            files = sorted((e.path for e in it if e.is_file()), key=natural_key)
+    except OSError as e:
+        return [], [(directory, e.strerror)]
+
+    workers = max(1, workers)
+    records = {}
+    changed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for file, checked in zip(files, pool.map(_check_host_file, [index] * len(files), files)):
+            if isinstance(checked, Exception):
+                errors.append((file, _error_text(checked)))
+            elif checked[2] is None:
+                changed.append(checked)
+            else:
+                records[file] = checked
+
+        parse_pool = pool
+        if use_processes and len(changed) > 1:
+            parse_pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            chunksize = max(1, len(changed) // (workers * 4)) if use_processes else 1
+            parsed = parse_pool.map(
+                _read_host_file, [c[0] for c in changed], chunksize=chunksize
+            )
+            for (key, stamp, _), record in zip(changed, parsed):
+                if isinstance(record, Exception):
+                    errors.append((key, _error_text(record)))
+                else:
+                    records[key] = (key, stamp, record)
+        finally:
+            if parse_pool is not pool:
+                parse_pool.shutdown()
+
     loaded_hosts = []
-    host = HostInfo("", [], [], "", "")
+    for file in files:
+        if file in records:
+            key, stamp, res = records[file]
+            index.store(key, stamp, res)
+            loaded_hosts.append(HostInfo(res[0], res[1], res[2], res[2][0], res[2][1]))
+
     try:
-        path = p.Path(directory)
-        if not path.exists():
-            raise RuntimeError("directory does not exist.")
-        else:
-            for h in [f for f in path.iterdir() if f.is_file()]:
-                host = HostInfo("", [], [], "", "")
-                host = load_host(h)
-                loaded_hosts.append(host)
-                host = None
+        index.save()
     except OSError as e:
-        pass
-    return loaded_hosts
+        errors.append((index_file, e.strerror))
+    if debug:
+        print("index hits: %d, parsed: %d" % (index.hits, index.misses))
+    return loaded_hosts, errors
+
+
+def natural_key(name) -> list:
+    # "192.168.1.10" -> ["", 192, ".", 168, ".", 1, ".", 10, ""]
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def _check_host_file(index, file):
+    try:
+        return index.check(file)
+    except OSError as e:
+        return e
+
+
+def _read_host_file(file):
+    # exceptions are returned rather than raised so one bad file
+    # does not stop the rest of the batch
+    try:
+        return read_host_facts(file)
+    except (OSError, ValueError) as e:
+        return e
+
+
+def _error_text(e) -> str:
+    if isinstance(e, OSError) and e.strerror:
+        return e.strerror
+    return str(e)
 
 
 """ =========================================================
@@ -86,84 +151,16 @@ TODO: Server groupings (custom config options)
 def write_inventory(hosts=[], inv_dir=""):
     if debug:
         print("Using directory: ", inv_dir)
-    inventory_out = Inventory(
-        items=[],
-        list_nipr=[],
-        list_dev=[],
-        list_stand_alone=[],
-        list_old_stand_alone=[],
-        list_unknown=[],
-        list_formatted_host_entries=[],
-        dict_unknown_subnet={},
-    )
-    # set our path and flag if it exists
-    path = p.Path(inv_dir)
-    dir_exists = path.exists()
     try:
         # create our output directory
-        if not dir_exists:
-            path.mkdir()
-        # iterate through all hosts
-        for h in hosts:
-            # instantiate blank host
-            host = HostInfo(
-                name="",
-                ip_list=[],
-                os_info_list=[],
-                os_distro="",
-                os_distro_version_major="",
-            )
-            # instantiate blank inventory entry
-            inventory_entry = InventoryEntry(
-                nipr_ip="",
-                dev_ip="",
-                stand_alone_ip="",
-                old_stand_alone_ip="",
-                unknown_subnet_ip="",
-                hostname="",
-                ip_list=[],
-                distro="",
-                release="",
-            )
-            # content: "{{ ansible_fqdn, ansible_all_ipv4_addresses, [os_distro, os_version] }}"
-            # ('localhost-live.maersk.homenet.lan', ['172.16.20.156', '172.16.30.161'], ['Fedora', '39'])
-            host = h
-            # add host to inventory entry
-            inventory_entry.add_host(h)
-            # store inventory entry in inventory
-            inventory_out.get_inventory_entries().append(inventory_entry)
-            # add ip to appropriate ip list
-            inventory_out.add_ip(inventory_entry.get_ip_list())
-            if debug:
-                print("inventory: ", inventory_out)
-            if debug:
-                print("inventory entry: ", inventory_entry)
-            # cleanup and prepare for the next iteration
-            host = None
-            inventory_entry = None
-
-        # iterate through inventory entries
-        for inv_entry in inventory_out.get_inventory_entries():
-            if debug:
-                print("parsing inventory entry: ", inv_entry)
-            host = HostInfo(
-                name="",
-                ip_list=[],
-                os_info_list=[],
-                os_distro_version_major="",
-                os_distro="",
-            )
-            if debug:
-                print("inventory obj: ", inv_entry)
-            # create distro/release directory structure, returning path to distro/release inventory file
-            inv_path = create_directory_structure(
-                inv_dir, inv_entry.get_distro(), inv_entry.get_release()
-            )
+        os.makedirs(inv_dir, exist_ok=True)
+        inventory_out = build_inventory(hosts)
 
-            # ignore anything but stand alone ip's since we dual home everything
-            write_stand_alone(
-                inv_path, inv_entry.get_host_name(), inv_entry.get_stand_alone_ip()
-            )
+        # group the host sections by distro/release, so each file is written once
+        by_release = group_by_release(inventory_out.get_inventory_entries())
+        for (distro, release), lines in by_release.items():
+            inv_path = create_directory_structure(inv_dir, distro, release)
+            write_file_atomic(inv_path, "".join(lines))
 
         if debug:
             print(inventory_out.get_inventory_entries())
@@ -171,7 +168,6 @@ def write_inventory(hosts=[], inv_dir=""):
             print(inventory_out.print_ips())
 
         # write ./inventories/inventory file, broken up across known subnets
-        # inventory_file = os.path.join(inv_dir, "inventory")
         write_subnets(
             os.path.join(inv_dir, "inventory"),
             inventory_out.get_unknown_ip_list(),
@@ -179,72 +175,252 @@ def write_inventory(hosts=[], inv_dir=""):
             inventory_out.get_old_stand_alone_ip_list(),
             inventory_out.get_nipr_ip_list(),
             inventory_out.get_dev_ip_list(),
+            inventory_out.get_dict_unknown_subnet(),
         )
     except OSError as e:
         print("there was a problem")
 
 
-def write_subnets(inv_file, list_unknown, list_sa, list_old_sa, list_nipr, list_dev):
-    # write out all hosts by subnet in top level inventory file
-    with open(inv_file, "w") as f:
-        if list_unknown:
-            if debug:
-                print("unknown ips: ", list_unknown)
-            f.write("\n[unknown]\n")
-            for ip in list_unknown:
-                f.write("%s\n" % ip)
+def write_inventory_file(hosts=[], inv_file="", fmt="ini"):
+    # one file holding every group and host var, see libinventoryformat
+    write_file_atomic(inv_file, format_inventory(build_inventory(hosts), fmt))
 
-        if list_nipr:
-            if debug:
-                print("nipr ips: ", list_nipr)
-            f.write("\n[nipr]\n")
-            for ip in list_nipr:
-                f.write("%s\n" % ip)
 
-        if list_dev:
-            if debug:
-                print("dev ips: ", list_dev)
-            f.write("\n[dev]\n")
-            for ip in list_dev:
-                f.write("%s\n" % ip)
+def build_inventory(hosts=[]) -> Inventory:
+    inventory_out = Inventory(
+        items=[],
+        list_nipr=[],
+        list_dev=[],
+        list_stand_alone=[],
+        list_old_stand_alone=[],
+        list_unknown=[],
+        list_formatted_host_entries=[],
+        dict_unknown_subnet={},
+    )
+    # content: "{{ ansible_fqdn, ansible_all_ipv4_addresses, [os_distro, os_version] }}"
+    # ('localhost-live.maersk.homenet.lan', ['172.16.20.156', '172.16.30.161'], ['Fedora', '39'])
+    for h in hosts:
+        inventory_entry = InventoryEntry(
+            nipr_ip="",
+            dev_ip="",
+            stand_alone_ip="",
+            old_stand_alone_ip="",
+            unknown_subnet_ip="",
+            hostname="",
+            ip_list=[],
+            distro="",
+            release="",
+        )
+        # add host to inventory entry, then store it and its ips in the inventory
+        inventory_entry.add_host(h)
+        inventory_out.add_entry(inventory_entry)
+        if debug:
+            print("inventory entry: ", inventory_entry)
+    return inventory_out
+
+
+""" =========================================================
+Incrementally update inventory files
+
+Keeps a manifest of the last generated state in the inventory
+directory: every host with its ips, distro/release and output
+file, a digest of each distro/release file and the subnet
+sections. Only the files whose content changed are rewritten,
+files of releases with no hosts left are removed.
+
+ReturnType: dict of added, removed, moved and changed hosts,
+            and the files and subnet sections rewritten
+============================================================="""
+
+MANIFEST_FILE = ".manifest.json"
+
+
+def write_inventory_incremental(hosts=[], inv_dir=""):
+    os.makedirs(inv_dir, exist_ok=True)
+    manifest_path = os.path.join(inv_dir, MANIFEST_FILE)
+    old = load_manifest(manifest_path)
+
+    inventory_out = build_inventory(hosts)
+    by_release = group_by_release(inventory_out.get_inventory_entries())
+    subnets = subnet_sections(
+        inventory_out.get_unknown_ip_list(),
+        inventory_out.get_stand_alone_ip_list(),
+        inventory_out.get_old_stand_alone_ip_list(),
+        inventory_out.get_nipr_ip_list(),
+        inventory_out.get_dev_ip_list(),
+        inventory_out.get_dict_unknown_subnet(),
+    )
+    new = build_manifest(inventory_out.get_inventory_entries(), by_release, subnets)
+    report = diff_manifest(old, new)
+
+    # distro/release files
+    report["files_written"] = []
+    for (distro, release), lines in by_release.items():
+        rel_path = os.path.join(distro, release, "inventory")
+        inv_path = os.path.join(inv_dir, rel_path)
+        if old["files"].get(rel_path) != new["files"][rel_path] or not os.path.exists(
+            inv_path
+        ):
+            inv_path = create_directory_structure(inv_dir, distro, release)
+            write_file_atomic(inv_path, "".join(lines))
+            report["files_written"].append(rel_path)
+
+    report["files_removed"] = []
+    for rel_path in old["files"]:
+        if rel_path not in new["files"]:
+            try:
+                os.remove(os.path.join(inv_dir, rel_path))
+            except FileNotFoundError:
+                pass
+            report["files_removed"].append(rel_path)
+
+    # subnet file, only when one of its sections changed
+    report["subnets_changed"] = [
+        section
+        for section in set(old["subnets"]) | set(new["subnets"])
+        if old["subnets"].get(section) != new["subnets"].get(section)
+    ]
+    subnet_file = os.path.join(inv_dir, "inventory")
+    if report["subnets_changed"] or not os.path.exists(subnet_file):
+        write_file_atomic(subnet_file, format_subnets(subnets))
+
+    write_file_atomic(manifest_path, json.dumps(new, indent=1, sort_keys=True))
+    return report
+
+
+def build_manifest(entries, by_release, subnets) -> dict:
+    manifest = {"version": 1, "hosts": {}, "files": {}, "subnets": {}}
+    for inv_entry in entries:
+        distro, release = inv_entry.get_distro(), inv_entry.get_release()
+        manifest["hosts"][inv_entry.get_host_name()] = {
+            "ips": list(inv_entry.get_ip_list()),
+            "distro": distro,
+            "release": release,
+            "file": os.path.join(distro, release, "inventory"),
+        }
+    for (distro, release), lines in by_release.items():
+        digest = hashlib.sha1("".join(lines).encode("utf-8")).hexdigest()
+        manifest["files"][os.path.join(distro, release, "inventory")] = digest
+    for section, ips in subnets:
+        manifest["subnets"][section] = list(ips)
+    return manifest
+
+
+def load_manifest(file) -> dict:
+    empty = {"version": 1, "hosts": {}, "files": {}, "subnets": {}}
+    try:
+        with open(file, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if not isinstance(manifest, dict) or manifest.get("version") != 1:
+        return empty
+    return manifest
+
+
+def diff_manifest(old, new) -> dict:
+    old_hosts, new_hosts = old["hosts"], new["hosts"]
+    report = {"added": [], "removed": [], "moved": [], "changed": []}
+    for name in sorted(set(old_hosts) | set(new_hosts)):
+        if name not in old_hosts:
+            report["added"].append(name)
+        elif name not in new_hosts:
+            report["removed"].append(name)
+        elif old_hosts[name]["file"] != new_hosts[name]["file"]:
+            report["moved"].append(
+                (name, old_hosts[name]["file"], new_hosts[name]["file"])
+            )
+        elif old_hosts[name]["ips"] != new_hosts[name]["ips"]:
+            report["changed"].append(name)
+    return report
+
+
+def print_report(report):
+    for name in report["added"]:
+        print("added:   %s" % name)
+    for name in report["removed"]:
+        print("removed: %s" % name)
+    for name, old_file, new_file in report["moved"]:
+        print("moved:   %s (%s -> %s)" % (name, old_file, new_file))
+    for name in report["changed"]:
+        print("changed: %s" % name)
+    print(
+        "%d added, %d removed, %d moved, %d changed; %d files written, %d removed, subnets changed: %s"
+        % (
+            len(report["added"]),
+            len(report["removed"]),
+            len(report["moved"]),
+            len(report["changed"]),
+            len(report["files_written"]),
+            len(report["files_removed"]),
+            ", ".join(sorted(report["subnets_changed"])) or "none",
+        )
+    )
 
-        if list_sa:
-            if debug:
-                print("standalone ips: ", list_sa)
-            f.write("\n[standalone]\n")
-            for ip in list_sa:
-                f.write("%s\n" % ip)
 
-        if list_old_sa:
+def group_by_release(entries) -> dict:
+    """map (distro, release) to the lines of its inventory file, in entry order"""
+    by_release = {}
+    for inv_entry in entries:
+        lines = by_release.setdefault(
+            (inv_entry.get_distro(), inv_entry.get_release()), []
+        )
+        # ignore anything but stand alone ip's since we dual home everything
+        lines.extend(
+            format_stand_alone(inv_entry.get_host_name(), inv_entry.get_stand_alone_ip())
+        )
+    return by_release
+
+
+def write_subnets(
+    inv_file, list_unknown, list_sa, list_old_sa, list_nipr, list_dev, extra={}
+):
+    # write out all hosts by subnet in top level inventory file
+    subnets = subnet_sections(
+        list_unknown, list_sa, list_old_sa, list_nipr, list_dev, extra
+    )
+    write_file_atomic(inv_file, format_subnets(subnets))
+
+
+def subnet_sections(
+    list_unknown, list_sa, list_old_sa, list_nipr, list_dev, extra={}
+) -> list:
+    # extra holds groups from a custom subnets.ini beyond the built in ones
+    return [
+        ("unknown", list_unknown),
+        ("nipr", list_nipr),
+        ("dev", list_dev),
+        ("standalone", list_sa),
+        ("old_standalone", list_old_sa),
+    ] + sorted(extra.items())
+
+
+def format_subnets(subnets) -> str:
+    lines = []
+    for section, ips in subnets:
+        if ips:
             if debug:
-                print("old standalone ips: ", list_old_sa)
-            f.write("\n[old_standalone]\n")
-            for ip in list_old_sa:
-                f.write("%s\n" % ip)
+                print("%s ips: " % section, ips)
+            lines.extend(format_section(section, ips))
+    return "".join(lines)
+
+
+def format_section(section, ips) -> list:
+    lines = ["\n[%s]\n" % section]
+    lines.extend("%s\n" % ip for ip in ips)
+    return lines
 
 
 def create_directory_structure(inventory_directory, distro, release) -> str:
-    os_path = os.path.join(inventory_directory, distro)
-    path = p.Path(os_path)
-    if not os.path.exists(os_path):
-        path = p.Path(os_path)
-        path.mkdir()
-    release_path = os.path.join(os_path, release)
-    inventory_path = os.path.join(release_path, "inventory")
-    if not os.path.exists(release_path):
-        path = p.Path(release_path)
-        path.mkdir()
-        path = p.Path(inventory_path)
-        path.touch()
-    return inventory_path
-
-
-def write_stand_alone(inv_path, host_name, ip):
+    release_path = os.path.join(inventory_directory, distro, release)
+    os.makedirs(release_path, exist_ok=True)
+    return os.path.join(release_path, "inventory")
+
+
+def format_stand_alone(host_name, ip) -> list:
     if ip:
-        file1 = open(inv_path, "a")  # append mode
-        file1.write("\n[%s]\n" % host_name)
-        file1.write("%s\n" % ip)
-        file1.close()
+        return ["\n[%s]\n" % host_name, "%s\n" % ip]
+    return []
 
 
 """ =========================================================
@@ -254,11 +430,53 @@ Define an entry point
 
 def main():
     hosts_info_directory = "./hosts"
+    hosts_index_file = "./hosts.index"
     inventory_directory = "./inventories"
+    subnets_file = "./subnets.ini"
+
+    parser = argparse.ArgumentParser(description="build inventories from ./hosts")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only rewrite inventory files affected since the last run",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(FORMATS),
+        help="write a single inventory file in this format instead of ./inventories",
+    )
+    parser.add_argument(
+        "--output", help="file for --format, defaults to ./inventory.<format>"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="host files to stat and parse at once, 1 to read them one by one",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="parse changed host files on a process pool instead of threads",
+    )
+    args = parser.parse_args()
+
+    # [SUBNETS] "cidr = group" lines, defaults to the first octet switch
+    if os.path.exists(subnets_file):
+        set_subnet_classifier(SubnetClassifier(load_subnets(subnets_file)))
 
     # load all host info from text files (tuples) in a given directory
-    hosts_loaded = load_hosts(hosts_info_directory)
-    write_inventory(hosts_loaded, inventory_directory)
+    hosts_loaded = load_hosts(
+        hosts_info_directory, hosts_index_file, args.workers, args.processes
+    )
+    if args.format:
+        write_inventory_file(
+            hosts_loaded, args.output or "./inventory.%s" % args.format, args.format
+        )
+    elif args.incremental:
+        print_report(write_inventory_incremental(hosts_loaded, inventory_directory))
+    else:
+        write_inventory(hosts_loaded, inventory_directory)
 
 
 # Check if the script is run as the main module
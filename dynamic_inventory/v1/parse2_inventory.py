@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+
+from libatomicfile import atomic_open
+
+# print debug messages to the console at runtime
+debug = False
+
+""" =========================================================
+Dynamic inventory script for the parse2 data model
+
+  parse2_inventory.py --list
+  parse2_inventory.py --host <hostname>
+
+Serves the Inventory built from ./hosts (next to this script, so
+ansible can run it from any directory) the way ansible's script
+plugin and fast_script expect.
+
+The --list JSON and every host's vars are serialized once and kept
+in ./inventory.cache together with a stamp of the facts directory
+and subnets.ini. While the stamp matches, --list is one read of the
+cache file written straight to stdout, and --host is a lookup in an
+on-disk hash table followed by one read, whatever the number of
+hosts. The cache is rebuilt when:
+  - a file is added, removed or replaced in ./hosts (gather_facts
+    writes through a rename, which bumps the directory mtime)
+  - subnets.ini is added, removed or changed
+  - --refresh is given
+
+Cache file layout:
+  line 1:  json header {"version", "stamp", "list_size", "slots"}
+  then:    list_size bytes of --list json
+  then:    slots hash table slots of (host hash, offset, length),
+           a power of two and at least twice the number of hosts,
+           found by linear probing; a zero hash is an empty slot
+  then:    one record per host, "<hostname>\n<host vars json>",
+           at offset from the start of the records
+============================================================="""
+
+CACHE_VERSION = 2
+
+SLOT = struct.Struct("<QQI")
+
+base_directory = os.path.dirname(os.path.abspath(__file__))
+hosts_info_directory = os.path.join(base_directory, "hosts")
+hosts_index_file = os.path.join(base_directory, "hosts.index")
+subnets_file = os.path.join(base_directory, "subnets.ini")
+cache_file = os.path.join(base_directory, "inventory.cache")
+
+
+def source_stamp() -> list:
+    """cheap fingerprint of everything the inventory is built from"""
+    stamp = []
+    for path in (hosts_info_directory, subnets_file):
+        try:
+            st = os.stat(path)
+            stamp.append([st.st_ino, st.st_mtime_ns, st.st_size])
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+
+def read_header(f) -> dict:
+    try:
+        header = json.loads(f.readline())
+    except ValueError:
+        return None
+    if not isinstance(header, dict) or header.get("version") != CACHE_VERSION:
+        return None
+    return header
+
+
+def load_cache(stamp) -> tuple:
+    """open the cache if it is current, return (file, header) or (None, None)"""
+    try:
+        f = open(cache_file, "rb")
+    except OSError:
+        return (None, None)
+    header = read_header(f)
+    if header is None or header.get("stamp") != stamp:
+        f.close()
+        return (None, None)
+    return (f, header)
+
+
+def build_cache(stamp):
+    """load ./hosts, serialize --list and each host's vars, write the cache"""
+    # imported here so a cache hit never pays for parse2 (or numpy)
+    import parse2
+    from libinventoryformat import build_model
+    from libinventoryinfo import set_subnet_classifier
+    from libsubnet import SubnetClassifier, load_subnets
+
+    if os.path.exists(subnets_file):
+        set_subnet_classifier(SubnetClassifier(load_subnets(subnets_file)))
+
+    hosts, errors = parse2.load_hosts_concurrent(
+        hosts_info_directory, hosts_index_file
+    )
+    # stderr only, stdout is the inventory
+    for file, error in errors:
+        print("%s: %s" % (file, error), file=sys.stderr)
+
+    model = build_model(parse2.build_inventory(hosts))
+    list_blob = json.dumps(model, sort_keys=True).encode("utf-8")
+    hostvars = model["_meta"]["hostvars"]
+    slots = 1
+    while slots < 2 * len(hostvars):
+        slots *= 2
+    table = [None] * slots
+    records = []
+    offset = 0
+    for host in sorted(hostvars):
+        record = b"%s\n%s" % (
+            host.encode("utf-8"),
+            json.dumps(hostvars[host], sort_keys=True).encode("utf-8"),
+        )
+        key = host_hash(host)
+        slot = key & (slots - 1)
+        while table[slot] is not None:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = SLOT.pack(key, offset, len(record))
+        records.append(record)
+        offset += len(record)
+    empty = SLOT.pack(0, 0, 0)
+    header = {
+        "version": CACHE_VERSION,
+        "stamp": stamp,
+        "list_size": len(list_blob),
+        "slots": slots,
+    }
+
+    with atomic_open(cache_file, "wb") as f:
+        f.write(json.dumps(header).encode("utf-8") + b"\n")
+        f.write(list_blob)
+        f.write(b"".join(empty if s is None else s for s in table))
+        f.writelines(records)
+    if debug:
+        print("rebuilt inventory cache: %d hosts" % len(records), file=sys.stderr)
+
+
+def open_cache(refresh=False) -> tuple:
+    stamp = source_stamp()
+    if not refresh:
+        (f, header) = load_cache(stamp)
+        if f is not None:
+            return (f, header)
+    build_cache(stamp)
+    (f, header) = load_cache(stamp)
+    if f is None:
+        raise RuntimeError("could not read back %s" % cache_file)
+    return (f, header)
+
+
+def list_inventory(out, refresh=False):
+    (f, header) = open_cache(refresh)
+    with f:
+        out.write(f.read(header["list_size"]))
+
+
+def host_hash(host) -> int:
+    # never 0, which marks an empty slot
+    key = int.from_bytes(
+        hashlib.blake2b(host.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+    return key or 1
+
+
+def find_host(f, header, host) -> bytes:
+    """return the vars json of host from the hash table, or None"""
+    slots = header["slots"]
+    table_start = f.tell() + header["list_size"]
+    records_start = table_start + slots * SLOT.size
+    name = host.encode("utf-8")
+    key = host_hash(host)
+    slot = key & (slots - 1)
+    for _ in range(slots):
+        f.seek(table_start + slot * SLOT.size)
+        (slot_key, offset, length) = SLOT.unpack(f.read(SLOT.size))
+        if slot_key == 0:
+            return None
+        if slot_key == key:
+            f.seek(records_start + offset)
+            (record_name, _, blob) = f.read(length).partition(b"\n")
+            if record_name == name:
+                return blob
+        slot = (slot + 1) & (slots - 1)
+    return None
+
+
+def host_variables(out, host, refresh=False):
+    (f, header) = open_cache(refresh)
+    with f:
+        blob = find_host(f, header, host)
+    # unknown hosts get an empty dict, as with ansible's own scripts
+    out.write(blob if blob is not None else b"{}")
+
+
+""" =========================================================
+Define an entry point
+============================================================="""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="ansible dynamic inventory built from ./hosts"
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--list", action="store_true", help="print the whole inventory")
+    group.add_argument("--host", help="print the vars of one host")
+    parser.add_argument(
+        "--refresh", action="store_true", help="rebuild the cache before answering"
+    )
+    args = parser.parse_args()
+
+    out = sys.stdout.buffer
+    if args.list:
+        list_inventory(out, args.refresh)
+    else:
+        host_variables(out, args.host, args.refresh)
+    out.write(b"\n")
+    out.flush()
+
+
+# Check if the script is run as the main module
+if __name__ == "__main__":
+    # Call the main function
+    main()